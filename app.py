@@ -1,102 +1,563 @@
-from flask import Flask, request, render_template, redirect, url_for, jsonify
-from deep_translator import GoogleTranslator
+from flask import Flask, request, render_template, redirect, url_for, jsonify, Response, stream_with_context
 import sqlite3
 import re
+import json
+import base64
 import os
+import threading
+import time
+import contextvars
+from contextlib import nullcontext
+from html import escape
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from flask_cors import CORS
+from glossary_snapshot import GlossarySnapshot, write_snapshot, remove_stale_snapshots
+from translation_cache import TranslationCache
+from text_chunker import split_chunks, strip_edges
+from database import ConnectionPool, migrate, search_terms, highlight, get_glossary_version
+from markupsafe import Markup
+from suggest_index import SuggestionIndex
+from translators import build_translator
+from single_flight import SingleFlight
+from metrics import Registry, Timings
 
 app = Flask(__name__)
 CORS(app)
-translator = GoogleTranslator(source='en', target='vi')
+
+# --- Backend dịch: chuỗi fallback có ngắt mạch, mặc định Google rồi tới glossary-only (không cần mạng).
+# TRANSLATOR_BACKENDS=stub để test/benchmark không gọi Google; mỗi lời gọi Google có hạn TRANSLATOR_TIMEOUT giây,
+# tối đa TRANSLATOR_WORKERS lời gọi cùng lúc (chế độ ASGI tự nâng theo ASGI_TRANSLATE_CONCURRENCY) ---
+TRANSLATOR_WORKERS = int(os.environ.get("TRANSLATOR_WORKERS", 32))
+translator = build_translator(
+    os.environ.get("TRANSLATOR_BACKENDS", "google,glossary"),
+    stub_latency=float(os.environ.get("TRANSLATOR_STUB_LATENCY", 0)),
+    timeout=float(os.environ.get("TRANSLATOR_TIMEOUT", 10)),
+    workers=TRANSLATOR_WORKERS,
+    threshold=int(os.environ.get("TRANSLATOR_BREAKER_THRESHOLD", 3)),
+    reset_timeout=float(os.environ.get("TRANSLATOR_BREAKER_RESET", 30))
+)
 
 # --- Kết nối SQLite ---
+# Mỗi request mượn một connection chỉ đọc từ pool (WAL, mmap), không dùng chung một connection
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "database1.db")
 try:
-    conn = sqlite3.connect('database1.db', check_same_thread=False)
+    db = ConnectionPool(DATABASE_PATH, size=int(os.environ.get("DATABASE_POOL_SIZE", 8)))
+    with db.writer() as writer:
+        migrate(writer)  # khoá chính, index, cột english_norm và bảng FTS cho Terms
 except sqlite3.Error as e:
     print(f"Lỗi khi kết nối tới SQLite: {e}")
 
-def get_terms(module_id=None, page=1, per_page=10):
-    cursor = conn.cursor()
-    offset = (page - 1) * per_page
+# --- Cache kết quả dịch (LRU trong bộ nhớ + SQLite cạnh database1.db) ---
+translation_cache = TranslationCache(
+    os.environ.get("TRANSLATION_CACHE_DB",
+                   os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), "translation_cache.db")),
+    max_size=int(os.environ.get("TRANSLATION_CACHE_SIZE", 2048)),
+    ttl=int(os.environ.get("TRANSLATION_CACHE_TTL", 24 * 3600)),
+    max_disk_rows=int(os.environ.get("TRANSLATION_CACHE_DISK_ROWS", 100000))
+)
+
+# --- Dịch song song các chunk của văn bản dài (số luồng tối đa cấu hình được) ---
+CHUNK_MAX_CHARS = int(os.environ.get("TRANSLATE_CHUNK_CHARS", 2000))
+TRANSLATE_CONCURRENCY = int(os.environ.get("TRANSLATE_CONCURRENCY", 4))
+translate_executor = ThreadPoolExecutor(max_workers=TRANSLATE_CONCURRENCY, thread_name_prefix="translate")
+
+def configure_translate_pool(max_workers):
+    # Chế độ ASGI có hàng trăm request dịch cùng lúc: pool chunk/nhóm phải lớn tương ứng,
+    # nếu không mọi request lô/stream/văn bản dài đều xếp hàng sau TRANSLATE_CONCURRENCY luồng
+    global translate_executor
+    old_executor = translate_executor
+    translate_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+    old_executor.shutdown(wait=False)
+    # Pool gọi Google cũng vậy: thiếu luồng thì lời gọi xếp hàng thay vì chạy song song
+    if max_workers > TRANSLATOR_WORKERS:
+        translator.set_workers(max_workers)
+
+# --- Gộp lời gọi upstream trùng nhau: nhiều người mở cùng một trang cùng lúc chỉ tốn một lần dịch.
+# Khoá là (loại lời gọi, module, phiên bản glossary, văn bản đã thay placeholder): "chunk" trả về chuỗi,
+# "group" trả về danh sách, nên cùng văn bản ở hai loại không được gộp vào nhau ---
+upstream_flights = SingleFlight()
+
+def submit_translate(fn, *args):
+    # Chạy trong pool nhưng giữ context của request, để thời gian các giai đoạn cộng vào đúng Timings
+    return translate_executor.submit(contextvars.copy_context().run, fn, *args)
+
+# --- Metrics Prometheus tại /metrics: thời gian từng giai đoạn, số thuật ngữ khớp, cache, upstream.
+# Header Server-Timing cho /api/translate: bật cho mọi request bằng TRANSLATE_SERVER_TIMING=1,
+# hoặc client gửi "X-Server-Timing: 1" cho riêng request đó ---
+SERVER_TIMING = os.environ.get("TRANSLATE_SERVER_TIMING", "0") == "1"
+metrics_registry = Registry()
+stage_seconds = metrics_registry.histogram(
+    "translate_stage_seconds", "Thời gian từng giai đoạn dịch (glossary, preprocess, upstream, postprocess)", ["stage"])
+request_seconds = metrics_registry.histogram(
+    "translate_request_seconds", "Thời gian xử lý /api/translate, stream tính tới dòng cuối", ["mode"])
+requests_total = metrics_registry.counter("translate_requests_total", "Số request /api/translate", ["mode", "status"])
+requests_inflight = metrics_registry.gauge("translate_requests_inflight", "Số request /api/translate đang xử lý", ["mode"])
+errors_total = metrics_registry.counter("translate_errors_total", "Số lỗi khi dịch, kể cả lỗi giữa stream", ["mode"])
+term_hits = metrics_registry.counter("translate_term_hits_total", "Số thuật ngữ glossary khớp trong văn bản nguồn", ["module"])
+
+def translator_stat(field):
+    return lambda: {(name,): stats[field] for name, stats in translator.stats().items()}
+
+metrics_registry.callback("translator_calls_total", "Số lời gọi tới từng backend dịch", "counter", translator_stat("calls"), ["backend"])
+metrics_registry.callback("translator_errors_total", "Số lỗi của từng backend dịch", "counter", translator_stat("errors"), ["backend"])
+metrics_registry.callback("translator_timeouts_total", "Số lỗi timeout của từng backend dịch", "counter", translator_stat("timeouts"), ["backend"])
+metrics_registry.callback(
+    "translator_circuit_open", "1 nếu backend đang bị ngắt mạch", "gauge",
+    lambda: {(name,): int(stats["circuit"] == "open") for name, stats in translator.stats().items()}, ["backend"])
+
+def cache_lookups():
+    stats = translation_cache.stats()
+    return {("memory",): stats["memory_hits"], ("disk",): stats["disk_hits"], ("miss",): stats["misses"]}
+
+metrics_registry.callback("translation_cache_lookups_total", "Số lần tra cache dịch theo kết quả", "counter", cache_lookups, ["result"])
+metrics_registry.callback(
+    "translation_cache_hit_ratio", "Tỉ lệ trúng cache dịch (bộ nhớ + SQLite)", "gauge",
+    lambda: {(): translation_cache.stats()["hit_ratio"]})
+metrics_registry.callback(
+    "upstream_inflight", "Số lời gọi upstream đang chạy (sau khi gộp trùng)", "gauge",
+    lambda: {(): upstream_flights.stats()["inflight"]})
+metrics_registry.callback(
+    "upstream_coalesced_total", "Số lời gọi upstream được gộp vào lời gọi đang chạy", "counter",
+    lambda: {(): upstream_flights.stats()["coalesced"]})
+
+# --- Phân trang keyset trên (english, id): trang nào cũng tốn như trang đầu ---
+_term_counts = {}
+_term_counts_version = None
+_term_counts_lock = threading.Lock()
+
+def encode_cursor(row):
+    # row: (id, english, ...) -> token an toàn cho URL
+    return base64.urlsafe_b64encode(json.dumps([row[1], row[0]]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(token):
+    try:
+        english, term_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return str(english), int(term_id)
+    except (ValueError, TypeError):
+        return None
+
+def count_terms(module_id=None):
+    # Số thuật ngữ mỗi module được cache, tự làm mới khi Terms bị ghi
+    global _term_counts_version
+    with _term_counts_lock:
+        version = glossary_version()
+        if version != _term_counts_version:
+            _term_counts.clear()
+            _term_counts_version = version
+        if module_id not in _term_counts:
+            with db.connection() as conn:
+                cursor = conn.cursor()
+                if module_id:
+                    cursor.execute("SELECT COUNT(*) FROM Terms WHERE module = ?", (module_id,))
+                else:
+                    cursor.execute("SELECT COUNT(*) FROM Terms")
+                _term_counts[module_id] = cursor.fetchone()[0]
+        return _term_counts[module_id]
+
+def get_terms(module_id=None, page=1, per_page=10, after=None, before=None):
+    # Trả về (terms, total_pages, next_cursor, prev_cursor). after/before là token keyset;
+    # không có token thì lấy trang đầu (hoặc dùng OFFSET cho link ?page=N cũ)
     terms = []
     total_count = 0
+    next_cursor = prev_cursor = None
+
+    columns = "id, english, vietnamese, note, vi_du" if module_id else "id, english, vietnamese, note, vi_du, module"
+    where = ["module = ?"] if module_id else []
+    params = [module_id] if module_id else []
+    order = "english ASC, id ASC"
+    offset = 0
+
+    after_key = decode_cursor(after) if after else None
+    before_key = decode_cursor(before) if before else None
+    if after_key:
+        where.append("(english, id) > (?, ?)")
+        params.extend(after_key)
+    elif before_key:
+        where.append("(english, id) < (?, ?)")
+        params.extend(before_key)
+        order = "english DESC, id DESC"
+    else:
+        offset = (page - 1) * per_page
+
+    sql = f"SELECT {columns} FROM Terms"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ? OFFSET ?"
 
     try:
-        if module_id:
-            cursor.execute("""
-                SELECT id, english, vietnamese, note, vi_du
-                FROM Terms
-                WHERE module = ?
-                ORDER BY english ASC
-                LIMIT ? OFFSET ?
-            """, (module_id, per_page, offset))
-            terms = cursor.fetchall()
-
-            cursor.execute("SELECT COUNT(*) FROM Terms WHERE module = ?", (module_id,))
-            total_count = cursor.fetchone()[0]
+        # Lấy dư một dòng để biết còn trang tiếp theo (hoặc trang trước khi đi lùi)
+        with db.connection() as conn:
+            terms = conn.execute(sql, params + [per_page + 1, offset]).fetchall()
+        has_more = len(terms) > per_page
+        terms = terms[:per_page]
+        if before_key:
+            terms.reverse()
+            has_prev, has_next = has_more, True
         else:
-            cursor.execute("""
-                SELECT id, english, vietnamese, note, vi_du, module
-                FROM Terms
-                ORDER BY english ASC
-                LIMIT ? OFFSET ?
-            """, (per_page, offset))
-            terms = cursor.fetchall()
-
-            cursor.execute("SELECT COUNT(*) FROM Terms")
-            total_count = cursor.fetchone()[0]
+            has_prev, has_next = bool(after_key) or offset > 0, has_more
+
+        if terms and has_next:
+            next_cursor = encode_cursor(terms[-1])
+        if terms and has_prev:
+            prev_cursor = encode_cursor(terms[0])
+
+        total_count = count_terms(module_id)
     except sqlite3.Error as e:
         print(f"Lỗi SQL trong get_terms: {e}")
 
     total_pages = (total_count + per_page - 1) // per_page
-    return terms, total_pages
-
-def preprocess_terms(text, module_id=None):
-    placeholders = {}
-    lower_text = text.lower()
-    cursor = conn.cursor()
-    terms = []
-
+    return terms, total_pages, next_cursor, prev_cursor
+
+# --- Glossary dùng chung giữa các worker: snapshot bất biến (glossary_snapshot.py) theo
+# phiên bản glossary, mỗi process chỉ mmap file thay vì tự dựng bộ so khớp từ Terms.
+# Khi phiên bản đổi, process đầu tiên nhận ra sẽ ghi snapshot mới, các process khác mở lại ---
+GLOSSARY_SNAPSHOT_DIR = os.environ.get("GLOSSARY_SNAPSHOT_DIR", os.path.dirname(os.path.abspath(DATABASE_PATH)))
+GLOSSARY_SNAPSHOT_PREFIX = os.path.join(GLOSSARY_SNAPSHOT_DIR, Path(DATABASE_PATH).stem + ".glossary-")
+
+_glossary = None
+_glossary_version = None
+_glossary_lock = threading.Lock()
+
+def glossary_version():
+    # Số phiên bản do trigger trên Terms tăng (xem database.MIGRATIONS v3): đọc một dòng, không quét bảng
+    with db.connection() as conn:
+        return get_glossary_version(conn)
+
+# --- Markup thay cho thuật ngữ: tính sẵn một lần cho mỗi thuật ngữ khi ghi snapshot,
+# mỗi request chỉ còn tra và ghép chuỗi. TERM_MARKUP chọn định dạng mặc định, request có thể
+# ghi đè bằng "markup". Sửa các hàm dưới đây thì tăng TERM_MARKUP_VERSION để dựng lại snapshot ---
+TERM_MARKUP_VERSION = "2"
+
+def tooltip_markup(english, vietnamese, note, module):
+    # title nằm trong dấu nháy đơn nên phải escape cả ' lẫn "
+    tooltip_text = f"{english} - {note}" if note else english
+    return f"<span data-bs-toggle='tooltip' title='{escape(tooltip_text)}'><b>{escape(vietnamese, quote=False)}</b></span>"
+
+def text_markup(english, vietnamese, note, module):
+    return vietnamese
+
+TERM_MARKUPS = {
+    "html": tooltip_markup,
+    "text": text_markup,
+}
+# "json" không phải markup chèn vào văn bản: placeholder giữ nguyên bộ thuật ngữ để postprocess_spans
+# trả về văn bản thuần kèm danh sách span (format=json của /api/translate)
+JSON_MARKUP = "json"
+TERM_MARKUP = os.environ.get("TERM_MARKUP", "html")
+if TERM_MARKUP not in TERM_MARKUPS:
+    raise ValueError(f"TERM_MARKUP không hỗ trợ: {TERM_MARKUP!r} (chọn {', '.join(TERM_MARKUPS)})")
+
+def load_snapshot(version):
+    path = f"{GLOSSARY_SNAPSHOT_PREFIX}{version}.snap"
     try:
-        if module_id:
-            cursor.execute("SELECT english, vietnamese, note FROM Terms WHERE module = ?", (module_id,))
-        else:
-            cursor.execute("SELECT english, vietnamese, note FROM Terms")
-        terms = cursor.fetchall()
-    except sqlite3.Error as e:
-        print(f"Lỗi SQL trong preprocess_terms: {e}")
-
-    terms.sort(key=lambda x: len(x[0]), reverse=True)
-
-    for i, (english, vietnamese, note) in enumerate(terms):
-        eng_lower = english.lower()
-        if eng_lower in lower_text:
-            placeholder = f"[[TERM{i}]]"
-            lower_text = lower_text.replace(eng_lower, placeholder)
-            tooltip_text = f"{english} - {note}" if note else english
-            tooltip_text = (
-                tooltip_text.replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace("\"", "&quot;")
-            )
-            placeholders[placeholder] = f"<span data-bs-toggle='tooltip' title='{tooltip_text}'><b>{vietnamese}</b></span>"
-
-    return lower_text, placeholders
+        snapshot = GlossarySnapshot(path)
+        if snapshot.tag == TERM_MARKUP_VERSION and snapshot.markups == list(TERM_MARKUPS):
+            return snapshot
+    except (OSError, ValueError):
+        pass
+
+    # Chưa có (hoặc hỏng): đọc phiên bản và Terms trong cùng một transaction để snapshot khớp đúng phiên bản
+    with db.connection() as conn:
+        conn.execute("BEGIN")
+        version = get_glossary_version(conn)
+        rows = conn.execute("SELECT english, vietnamese, note, module FROM Terms").fetchall()
+    path = f"{GLOSSARY_SNAPSHOT_PREFIX}{version}.snap"
+    write_snapshot(path, rows, version, TERM_MARKUPS, tag=TERM_MARKUP_VERSION)
+    remove_stale_snapshots(f"{GLOSSARY_SNAPSHOT_PREFIX}*.snap", keep=path)
+    return GlossarySnapshot(path)
+
+def build_glossary(version):
+    snapshot = load_snapshot(version)
+    return {
+        "snapshot": snapshot,
+        "suggestions": SuggestionIndex([(english, vietnamese, module) for english, vietnamese, _, module in snapshot.rows()])
+    }
+
+def get_glossary():
+    global _glossary, _glossary_version
+    with _glossary_lock:
+        try:
+            version = glossary_version()
+            if version != _glossary_version:
+                # Gán một lần: request đang chạy vẫn giữ snapshot cũ cho tới khi xong
+                _glossary = build_glossary(version)
+                _glossary_version = _glossary["snapshot"].version
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Lỗi khi nạp glossary: {e}")
+            if _glossary is None:
+                raise
+        return _glossary
+
+def get_term_matcher(module_id=None):
+    return get_glossary()["snapshot"].matcher(module_id)
+
+# Placeholder có thể bị Google đổi hoa/thường hoặc chèn khoảng trắng, ví dụ "[[ Term3 ]]"
+PLACEHOLDER_PATTERN = re.compile(r"\[\[\s*TERM\s*(\d+)\s*\]\]", re.IGNORECASE)
+
+def preprocess_terms(text, module_id=None, matcher=None, markup=TERM_MARKUP):
+    # Giữ nguyên hoa/thường của văn bản gốc, chỉ thay các thuật ngữ khớp trọn từ
+    placeholders = {}
+    if matcher is None:
+        with stage_seconds.time(stage="glossary"):
+            matcher = get_term_matcher(module_id)
+
+    with stage_seconds.time(stage="preprocess"):
+        parts = []
+        hits = {}
+        last = 0
+        for start, end, index, term in matcher.find(text):
+            placeholder = f"[[TERM{index}]]"
+            parts.append(text[last:start])
+            parts.append(placeholder)
+            last = end
+            placeholders[placeholder] = term if markup == JSON_MARKUP else term[4][markup]
+            hits[term[3]] = hits.get(term[3], 0) + 1
+        parts.append(text[last:])
+    for module, count in hits.items():
+        term_hits.inc(count, module=module)
+
+    return "".join(parts), placeholders
 
 def postprocess_terms(text, placeholders):
-    for placeholder, replacement in placeholders.items():
-        pattern = re.compile(re.escape(placeholder), re.IGNORECASE)
-        text = pattern.sub(replacement, text)
-    return text
+    # Khôi phục tất cả placeholder trong một lượt quét
+    def restore(match):
+        return placeholders.get(f"[[TERM{match.group(1)}]]", match.group(0))
+
+    if not placeholders:
+        return text
+    return PLACEHOLDER_PATTERN.sub(restore, text)
+
+def postprocess_spans(text, placeholders):
+    # format=json: thay placeholder bằng nghĩa tiếng Việt, trả về (văn bản thuần, spans);
+    # start/end tính theo ký tự trong văn bản trả về, note chỉ có khi thuật ngữ có ghi chú
+    parts = []
+    spans = []
+    last = 0
+    length = 0
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        term = placeholders.get(f"[[TERM{match.group(1)}]]")
+        if term is None:
+            continue
+        english, _, note, module, markups = term
+        replacement = markups["text"]
+        before = text[last:match.start()]
+        parts.append(before)
+        parts.append(replacement)
+        start = length + len(before)
+        length = start + len(replacement)
+        last = match.end()
+        span = {"start": start, "end": length, "english": english, "module": module}
+        if note:
+            span["note"] = note
+        spans.append(span)
+    parts.append(text[last:])
+    return "".join(parts), spans
+
+def restore_terms(text, placeholders, markup=TERM_MARKUP):
+    with stage_seconds.time(stage="postprocess"):
+        if markup == JSON_MARKUP:
+            return postprocess_spans(text, placeholders)
+        return postprocess_terms(text, placeholders)
+
+def result_fields(result, key="content"):
+    # Kết quả là (văn bản, spans) khi format=json, ngược lại là chuỗi đã chèn markup
+    if isinstance(result, tuple):
+        return {key: result[0], "spans": result[1]}
+    return {key: result}
+
+def translate_chunk(chunk, scope, version):
+    lead, core, trail = strip_edges(chunk)
+    if not core:
+        return chunk
+    translated = translation_cache.get(core, scope, version)
+    if translated is None:
+        translated = upstream_flights.do(("chunk", scope, version, core), translate_upstream, core, scope, version)
+    return lead + translated + trail
+
+def translate_upstream(text, scope, version):
+    # Chỉ chạy ở luồng dẫn đầu của SingleFlight; các request trùng chờ kết quả này
+    with stage_seconds.time(stage="upstream"):
+        translated, backend = translator.translate_with_backend(text)
+    if backend.cacheable:
+        translation_cache.put(text, scope, version, translated)
+    return translated
+
+def translate_group_upstream(group, scope, version):
+    with stage_seconds.time(stage="upstream"):
+        joined, backend = translator.translate_with_backend("\n".join(group))
+        parts = joined.split("\n")
+        results = [(part, backend) for part in parts]
+        if len(parts) != len(group):
+            # Kết quả bị gộp/tách dòng: dịch lại từng đoạn cho chắc
+            results = [translator.translate_with_backend(text) for text in group]
+    for text, (translated, backend) in zip(group, results):
+        if backend.cacheable:
+            translation_cache.put(text, scope, version, translated)
+    return [translated for translated, _ in results]
+
+def translate_cached(pre_text, module_id=None, version=None, parallel=True):
+    # Văn bản dài được chia theo câu/đoạn và dịch đồng thời, rồi ghép lại đúng thứ tự.
+    # parallel=False khi đã chạy trong luồng của pool để tránh chờ lồng nhau.
+    scope = str(module_id) if module_id else "*"
+    chunks = split_chunks(pre_text, CHUNK_MAX_CHARS)
+    if len(chunks) == 1:
+        return translate_chunk(pre_text, scope, version)
+    if not parallel:
+        return "".join(translate_chunk(chunk, scope, version) for chunk in chunks)
+    futures = [submit_translate(translate_chunk, chunk, scope, version) for chunk in chunks]
+    return "".join(future.result() for future in futures)
+
+def translate_with_glossary(text, module_id=None, parallel=True, markup=TERM_MARKUP):
+    with stage_seconds.time(stage="glossary"):
+        matcher = get_term_matcher(module_id)
+    pre_text, placeholders = preprocess_terms(text, module_id, matcher=matcher, markup=markup)
+    translated = translate_cached(pre_text, module_id, matcher.version, parallel=parallel)
+    return restore_terms(translated, placeholders, markup)
+
+def stream_translation(text, module_id=None, markup=TERM_MARKUP):
+    # Chia văn bản gốc thành chunk, dịch đồng thời và trả về từng chunk (NDJSON)
+    # ngay khi xong, kèm vị trí offset/length trong văn bản gốc
+    chunks = split_chunks(text, CHUNK_MAX_CHARS)
+    offsets = []
+    offset = 0
+    for chunk in chunks:
+        offsets.append(offset)
+        offset += len(chunk)
+
+    yield json.dumps({"chunks": len(chunks), "length": len(text)}) + "\n"
+
+    futures = {
+        submit_translate(translate_with_glossary, chunk, module_id, False, markup): i
+        for i, chunk in enumerate(chunks)
+    }
+    for future in as_completed(futures):
+        i = futures[future]
+        event = {"index": i, "offset": offsets[i], "length": len(chunks[i])}
+        try:
+            event.update(result_fields(future.result()))
+        except Exception as e:
+            print(f"Lỗi khi dịch chunk {i}: {e}")
+            errors_total.inc(mode="text-stream")
+            event["error"] = str(e)
+        yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    yield json.dumps({"done": True}) + "\n"
+
+# --- Dịch theo lô: gộp nhiều đoạn vào ít lần gọi translator nhất có thể ---
+BATCH_MAX_CHARS = 4500  # Google giới hạn 5000 ký tự mỗi lần gọi
+BATCH_MAX_SEGMENTS = 1000
+
+def pack_segments(texts, max_chars=BATCH_MAX_CHARS):
+    # Các đoạn một dòng được nối bằng "\n" (Google giữ nguyên xuống dòng);
+    # đoạn có sẵn xuống dòng hoặc quá dài được gửi riêng
+    groups = []
+    current = []
+    size = 0
+    for text in texts:
+        if "\n" in text or len(text) >= max_chars:
+            groups.append([text])
+            continue
+        if current and size + len(text) + 1 > max_chars:
+            groups.append(current)
+            current = []
+            size = 0
+        current.append(text)
+        size += len(text) + 1
+    if current:
+        groups.append(current)
+    return groups
+
+def iter_batch_translations(pre_texts, module_id=None, version=None):
+    # Sinh (pre_text, bản dịch) cho từng đoạn khác nhau ngay khi có kết quả:
+    # trước hết là các đoạn có sẵn trong cache, sau đó là từng nhóm dịch xong
+    scope = str(module_id) if module_id else "*"
+    pending = []
+    seen = set()
+    for text in pre_texts:
+        if text in seen:
+            continue
+        seen.add(text)
+        if not text.strip():
+            yield text, text
+            continue
+        cached = translation_cache.get(text, scope, version)
+        if cached is None:
+            pending.append(text)
+        else:
+            yield text, cached
+
+    def translate_group(group):
+        if len(group) == 1:
+            return [translate_cached(group[0], module_id, version, parallel=False)]
+        # Cùng một trang cho ra cùng các nhóm, nên nhóm trùng cũng được gộp
+        key = ("group", scope, version, "\n".join(group))
+        return upstream_flights.do(key, translate_group_upstream, group, scope, version)
+
+    futures = {submit_translate(translate_group, group): group for group in pack_segments(pending)}
+    for future in as_completed(futures):
+        for text, translated in zip(futures[future], future.result()):
+            yield text, translated
+
+def translate_batch_cached(pre_texts, module_id=None, version=None):
+    results = dict(iter_batch_translations(pre_texts, module_id, version))
+    return [results[text] for text in pre_texts]
+
+def translate_many_with_glossary(texts, module_id=None, markup=TERM_MARKUP):
+    with stage_seconds.time(stage="glossary"):
+        matcher = get_term_matcher(module_id)
+    prepared = [preprocess_terms(text, module_id, matcher=matcher, markup=markup) for text in texts]
+    translated = translate_batch_cached([pre_text for pre_text, _ in prepared], module_id, matcher.version)
+    return [restore_terms(t, placeholders, markup) for t, (_, placeholders) in zip(translated, prepared)]
+
+def iter_segment_translations(segments, module_id=None, markup=TERM_MARKUP):
+    # segments: danh sách (id, text). Các text trùng nhau chỉ được dịch một lần,
+    # mỗi kết quả được trả về cho tất cả id có cùng nội dung
+    with stage_seconds.time(stage="glossary"):
+        matcher = get_term_matcher(module_id)
+    ids_by_pre_text = {}
+    placeholders_by_pre_text = {}
+    for segment_id, text in segments:
+        pre_text, placeholders = preprocess_terms(text, module_id, matcher=matcher, markup=markup)
+        ids_by_pre_text.setdefault(pre_text, []).append(segment_id)
+        placeholders_by_pre_text[pre_text] = placeholders
+
+    for pre_text, translated in iter_batch_translations(list(ids_by_pre_text), module_id, matcher.version):
+        content = restore_terms(translated, placeholders_by_pre_text[pre_text], markup)
+        for segment_id in ids_by_pre_text[pre_text]:
+            yield segment_id, content
+
+def stream_segments(segments, module_id=None, markup=TERM_MARKUP):
+    yield json.dumps({"segments": len(segments)}) + "\n"
+    try:
+        for segment_id, content in iter_segment_translations(segments, module_id, markup):
+            yield json.dumps({"id": segment_id, **result_fields(content)}, ensure_ascii=False) + "\n"
+    except Exception as e:
+        print(f"Lỗi khi dịch segments: {e}")
+        errors_total.inc(mode="segments-stream")
+        yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+    yield json.dumps({"done": True}) + "\n"
+
+def parse_segments(raw):
+    # [{"id": ..., "text": ...}, ...] -> [(id, text), ...]; None nếu sai định dạng
+    if not isinstance(raw, list):
+        return None
+    segments = []
+    for item in raw:
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str):
+            return None
+        segment_id = item.get("id")
+        if not isinstance(segment_id, (str, int)) or isinstance(segment_id, bool):
+            return None
+        segments.append((segment_id, item["text"]))
+    return segments
 
 @app.route("/", methods=["GET", "POST"])
 def index():
-    cursor = conn.cursor()
     modules = []
     try:
-        cursor.execute("SELECT DISTINCT module FROM Terms ORDER BY module")
-        modules = [row[0] for row in cursor.fetchall()]
+        with db.connection() as conn:
+            modules = [row[0] for row in conn.execute("SELECT DISTINCT module FROM Terms ORDER BY module")]
     except sqlite3.Error as e:
         print(f"Lỗi SQL khi lấy modules cho index: {e}")
 
@@ -116,10 +577,7 @@ def index():
             result = "<i>Vui lòng nhập văn bản cần dịch.</i>"
         else:
             try:
-                pre_text, placeholders = preprocess_terms(input_text, module_id)
-                # Sửa lỗi deep_translator: .translate() trả về string trực tiếp
-                translated = translator.translate(pre_text)
-                result = postprocess_terms(translated, placeholders)
+                result = translate_with_glossary(input_text, module_id)
             except Exception as e:
                 print(f"Lỗi khi dịch: {e}")
                 result = f"<i class='text-danger'>Đã xảy ra lỗi trong quá trình dịch: {e}</i>"
@@ -134,11 +592,10 @@ def index():
 
 @app.route("/modules", methods=["GET", "POST"])
 def modules():
-    cursor = conn.cursor()
     modules_list = []
     try:
-        cursor.execute("SELECT DISTINCT module FROM Terms ORDER BY module")
-        modules_list = [row[0] for row in cursor.fetchall()]
+        with db.connection() as conn:
+            modules_list = [row[0] for row in conn.execute("SELECT DISTINCT module FROM Terms ORDER BY module")]
     except sqlite3.Error as e:
         print(f"Lỗi SQL trong modules: {e}")
 
@@ -152,13 +609,14 @@ def modules():
         search_term = request.form.get("term", "").strip()
         if search_term:
             try:
-                cursor.execute("""
-                    SELECT module, english, vietnamese, note, vi_du
-                    FROM Terms
-                    WHERE LOWER(english) LIKE ?
-                    ORDER BY module, english
-                """, (f"%{search_term.lower()}%",))
-                results = cursor.fetchall()
+                # Tìm toàn văn (BM25) trên english, vietnamese, note, boi_canh, vi_du
+                with db.connection() as conn:
+                    rows = search_terms(conn, search_term, limit=100)
+                results = [
+                    (module, Markup(highlight(english, search_term)), Markup(highlight(vietnamese, search_term)),
+                     Markup(highlight(note, search_term, width=200)), Markup(highlight(vi_du, search_term, width=200)))
+                    for _, module, english, vietnamese, note, _, vi_du, _ in rows
+                ]
             except sqlite3.Error as e:
                 print(f"Lỗi SQL khi tìm kiếm /modules: {e}")
 
@@ -173,26 +631,30 @@ def modules():
 
 @app.route("/terms/<string:module_id>", methods=["GET", "POST"])
 def terms(module_id):
-    page = int(request.args.get("page", 1))
+    page = max(request.args.get("page", 1, type=int), 1)
     per_page = 10
-    cursor = conn.cursor()
     query_term = ""
     terms_list = []
     total_pages = 1
+    next_cursor = prev_cursor = None
 
     try:
         if request.method == "POST":
             query_term = request.form.get("term", "").strip().lower()
-            cursor.execute("""
-                SELECT id, english, vietnamese, note, vi_du
-                FROM Terms
-                WHERE module = ? AND (LOWER(english) LIKE ? OR LOWER(vietnamese) LIKE ?)
-                ORDER BY english ASC
-            """, (module_id, f"%{query_term}%", f"%{query_term}%"))
-            terms_list = cursor.fetchall()
+            with db.connection() as conn:
+                rows = search_terms(conn, query_term, module_id, limit=200)
+            terms_list = [
+                (term_id, Markup(highlight(english, query_term)), Markup(highlight(vietnamese, query_term)),
+                 Markup(highlight(note, query_term)), Markup(highlight(vi_du, query_term)))
+                for term_id, _, english, vietnamese, note, _, vi_du, _ in rows
+            ]
             total_pages = 1
         else:
-            terms_list, total_pages = get_terms(module_id, page, per_page)
+            terms_list, total_pages, next_cursor, prev_cursor = get_terms(
+                module_id, page, per_page,
+                after=request.args.get("after"),
+                before=request.args.get("before")
+            )
     except sqlite3.Error as e:
         print(f"Lỗi SQL trong /terms/{module_id}: {e}")
 
@@ -202,50 +664,176 @@ def terms(module_id):
         terms=terms_list,
         query=query_term,
         page=page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
     )
 
-@app.route("/api/translate", methods=["POST"])
-def api_translate():
-    data = request.json
+def translate_mode(data):
+    mode = "segments" if "segments" in data else "texts" if "texts" in data else "text"
+    return f"{mode}-stream" if data.get("stream") else mode
+
+def handle_translate_request(data, timings=None):
+    # Xử lý body JSON của /api/translate, dùng chung cho Flask và chế độ ASGI (asgi.py).
+    # Trả về ("json", dict, status) hoặc ("stream", generator NDJSON, 200).
+    # timings: Timings của request nếu cần header Server-Timing.
+    # Số request theo status do tầng HTTP ghi (record_translate_response), vì ASGI có thể đã trả 504
+    mode = translate_mode(data)
+    started = time.perf_counter()
+    with requests_inflight.track(mode=mode), timings.activate() if timings else nullcontext():
+        kind, payload, status = dispatch_translate_request(data)
+    if kind == "stream":
+        return kind, track_stream(payload, mode, started), status
+    return kind, payload, status
+
+def record_translate_response(data, status, started, stream=False):
+    # Gọi khi đã biết status thật gửi cho client (kể cả 503/504 của chế độ ASGI)
+    mode = translate_mode(data)
+    requests_total.inc(mode=mode, status=status)
+    if status >= 500:
+        errors_total.inc(mode=mode)
+    if not stream:
+        request_seconds.observe(time.perf_counter() - started, mode=mode)
+
+def track_stream(lines, mode, started):
+    # Request stream vẫn đang xử lý cho tới khi gửi xong dòng cuối
+    with requests_inflight.track(mode=mode):
+        yield from lines
+    request_seconds.observe(time.perf_counter() - started, mode=mode)
+
+def dispatch_translate_request(data):
+    module_id = data.get("module_id") or None
+    # "markup": "html" (mặc định, span tooltip) hoặc "text" (chỉ nghĩa tiếng Việt).
+    # "format": "json" -> văn bản thuần kèm "spans": [{start, end, english, module, note}],
+    # client không phải bóc HTML nữa
+    markup = data.get("markup") or TERM_MARKUP
+    if markup not in TERM_MARKUPS:
+        return "json", {"error": f"'markup' phải là một trong: {', '.join(TERM_MARKUPS)}"}, 400
+    output_format = data.get("format") or "html"
+    if output_format not in ("html", "json"):
+        return "json", {"error": "'format' phải là 'html' hoặc 'json'"}, 400
+    if output_format == "json":
+        markup = JSON_MARKUP
+
+    # Dạng text node của extension: {"segments": [{"id": ..., "text": ...}]}
+    # -> {"translations": {id: nội dung đã dịch}}, hoặc NDJSON nếu "stream": true
+    if "segments" in data:
+        segments = parse_segments(data.get("segments"))
+        if segments is None:
+            return "json", {"error": "'segments' phải là mảng các {id, text}"}, 400
+        if len(segments) > BATCH_MAX_SEGMENTS:
+            return "json", {"error": f"Tối đa {BATCH_MAX_SEGMENTS} đoạn mỗi yêu cầu"}, 400
+        if data.get("stream"):
+            return "stream", stream_segments(segments, module_id, markup), 200
+        try:
+            translations = {
+                str(segment_id): result_fields(content) if markup == JSON_MARKUP else content
+                for segment_id, content in iter_segment_translations(segments, module_id, markup)
+            }
+            return "json", {"translations": translations}, 200
+        except Exception as e:
+            print(f"Lỗi API translate (segments): {e}")
+            return "json", {"error": str(e)}, 500
+
+    # Dạng lô: {"texts": [...]} -> {"translations": [{"content": ...}, ...]} theo đúng thứ tự
+    if "texts" in data:
+        texts = data.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return "json", {"error": "'texts' phải là một mảng chuỗi"}, 400
+        if len(texts) > BATCH_MAX_SEGMENTS:
+            return "json", {"error": f"Tối đa {BATCH_MAX_SEGMENTS} đoạn mỗi yêu cầu"}, 400
+        try:
+            results = translate_many_with_glossary(texts, module_id, markup)
+            return "json", {"translations": [result_fields(r) for r in results]}, 200
+        except Exception as e:
+            print(f"Lỗi API translate (batch): {e}")
+            return "json", {"error": str(e)}, 500
+
     text_to_translate = data.get("text", "")
     if not text_to_translate.strip():
-        return jsonify({"translated_text": ""})
+        return "json", result_fields(("", []) if markup == JSON_MARKUP else "", "translated_text"), 200
+
+    # Chế độ stream: {"text": ..., "stream": true} -> NDJSON, mỗi dòng một chunk đã dịch
+    if data.get("stream"):
+        return "stream", stream_translation(text_to_translate, module_id, markup), 200
 
     try:
-        pre_text, placeholders = preprocess_terms(text_to_translate, module_id=None)
-        translated = translator.translate(pre_text)  # <-- sửa ở đây
-        final_text = postprocess_terms(translated, placeholders)
-        return jsonify({"translated_text": final_text})
+        final_text = translate_with_glossary(text_to_translate, module_id, markup=markup)
+        return "json", result_fields(final_text, "translated_text"), 200
     except Exception as e:
         print(f"Lỗi API translate: {e}")
-        return jsonify({"error": str(e)}), 500
+        return "json", {"error": str(e)}, 500
 
-@app.route("/api/suggestions", methods=["GET"])
-def api_suggestions():
-    query = request.args.get("q", "").strip().lower()
-    module_id = request.args.get("module_id")
-
-    if not query:
-        return jsonify([])
+def wants_server_timing(header_value):
+    return SERVER_TIMING or header_value == "1"
 
-    cursor = conn.cursor()
-    suggestions = []
+@app.route("/api/translate", methods=["POST"])
+def api_translate():
+    timings = Timings() if wants_server_timing(request.headers.get("X-Server-Timing")) else None
+    started = time.perf_counter()
+    data = request.json
+    kind, payload, status = handle_translate_request(data, timings)
+    record_translate_response(data, status, started, stream=kind == "stream")
+    if kind == "stream":
+        return Response(stream_with_context(payload), mimetype="application/x-ndjson")
+    response = jsonify(payload)
+    if timings:
+        response.headers["Server-Timing"] = timings.header()
+    return response, status
+
+@app.route("/api/search", methods=["GET"])
+def api_search():
+    query = request.args.get("q", "").strip()
+    module_id = request.args.get("module_id") or None
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
 
+    results = []
     try:
-        sql_query = "SELECT DISTINCT english FROM Terms WHERE LOWER(english) LIKE ?"
-        params = [f"{query}%"]
+        with db.connection() as conn:
+            rows = search_terms(conn, query, module_id, limit)
+        for term_id, module, english, vietnamese, note, boi_canh, vi_du, score in rows:
+            # Đoạn trích từ cột giải thích đầu tiên có từ khớp
+            snippet = ""
+            for text in (note, boi_canh, vi_du):
+                marked = highlight(text, query, width=160)
+                if "<mark>" in marked:
+                    snippet = marked
+                    break
+            results.append({
+                "id": term_id,
+                "module": module,
+                "english": english,
+                "vietnamese": vietnamese,
+                "note": note,
+                "score": round(-score, 4),
+                "highlight": {"english": highlight(english, query), "vietnamese": highlight(vietnamese, query)},
+                "snippet": snippet
+            })
+    except sqlite3.Error as e:
+        print(f"Lỗi SQL trong /api/search: {e}")
 
-        if module_id and module_id.isdigit():
-            sql_query += " AND module = ?"
-            params.append(module_id)
+    return jsonify(results)
 
-        sql_query += " ORDER BY english ASC LIMIT 10"
-        cursor.execute(sql_query, tuple(params))
-        suggestions = [row[0] for row in cursor.fetchall()]
-    except sqlite3.Error as e:
-        print(f"Lỗi SQL trong /api/suggestions: {e}")
+@app.route("/api/translators/stats", methods=["GET"])
+def api_translators_stats():
+    return jsonify(translator.stats())
+
+@app.route("/api/cache/stats", methods=["GET"])
+def api_cache_stats():
+    return jsonify(dict(translation_cache.stats(), upstream=upstream_flights.stats()))
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/suggestions", methods=["GET"])
+def api_suggestions():
+    # Gợi ý từ chỉ mục trong bộ nhớ (tiền tố tiếng Anh/tiếng Việt, rồi gần đúng), không truy vấn DB
+    query = request.args.get("q", "")
+    module_id = request.args.get("module_id") or None
+    fuzzy = request.args.get("fuzzy", "1") != "0"
 
+    suggestions = get_glossary()["suggestions"].suggest(query, module_id, limit=10, fuzzy=fuzzy)
     return jsonify(suggestions)
 
 if __name__ == "__main__":
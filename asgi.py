@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import (
+    app, configure_translate_pool, get_glossary, handle_translate_request, record_translate_response,
+    wants_server_timing
+)
+from metrics import Timings
+
+# --- Chế độ ASGI: uvicorn asgi:application ---
+# /api/translate và /api/suggestions chạy trực tiếp trên event loop: lời gọi translator
+# (blocking) được đẩy sang thread pool và await, có semaphore giới hạn số request đang dịch
+# cùng lúc và timeout cho mỗi request. Các route còn lại (trang HTML, POST /, /metrics...) chạy
+# qua Flask trong pool ASGI_WSGI_THREADS luồng: vẫn là code blocking, quá số luồng đó thì xếp hàng.
+# Một chỗ trong semaphore chỉ được trả khi luồng dịch thực sự xong (kể cả sau 504), nên số
+# việc dịch đang chạy không bao giờ vượt ASGI_MAX_INFLIGHT.
+MAX_INFLIGHT = int(os.environ.get("ASGI_MAX_INFLIGHT", 256))
+REQUEST_TIMEOUT = float(os.environ.get("ASGI_REQUEST_TIMEOUT", 60))
+# Pool dịch chunk/nhóm của app.py, mặc định cùng cỡ với số request đang dịch
+TRANSLATE_CONCURRENCY = int(os.environ.get("ASGI_TRANSLATE_CONCURRENCY", MAX_INFLIGHT))
+
+WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", 32))
+
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="asgi-wsgi")
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # WsgiToAsgi mặc định chạy app bằng sync_to_async(thread_sensitive=True): mọi request Flask
+    # nối đuôi nhau trên cùng một luồng. Ở đây mỗi request chạy trên một luồng của wsgi_executor
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.run_wsgi_app.__wrapped__, thread_sensitive=False,
+                                 executor=wsgi_executor)
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_application = ThreadedWsgiToAsgi(app)
+upstream_executor = ThreadPoolExecutor(max_workers=MAX_INFLIGHT, thread_name_prefix="asgi-translate")
+configure_translate_pool(TRANSLATE_CONCURRENCY)
+_inflight = None  # asyncio.Semaphore, tạo khi đã có event loop
+
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+_END = object()
+
+
+def submit_blocking(func, *args):
+    # Trả về asyncio.Future của lời gọi trong thread pool (dùng với asyncio.shield để timeout
+    # không huỷ mất dấu việc vẫn đang chạy trong luồng)
+    return asyncio.get_running_loop().run_in_executor(upstream_executor, func, *args)
+
+
+async def run_blocking(func, *args):
+    return await submit_blocking(func, *args)
+
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        + CORS_HEADERS + list(headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_stream(send, lines):
+    # lines là generator NDJSON đồng bộ: mỗi lần next() chạy trong thread pool.
+    # Trả về future của next() còn đang chạy nếu bị timeout, ngược lại None
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/x-ndjson")] + CORS_HEADERS
+    })
+    pending = None
+    while True:
+        future = submit_blocking(next, lines, _END)
+        try:
+            line = await asyncio.wait_for(asyncio.shield(future), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            pending = future
+            line = json.dumps({"error": "Quá thời gian chờ dịch"}, ensure_ascii=False) + "\n"
+            await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+            break
+        if line is _END:
+            break
+        await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+    return pending
+
+
+async def translate_endpoint(scope, receive, send):
+    global _inflight
+    if _inflight is None:
+        _inflight = asyncio.Semaphore(MAX_INFLIGHT)
+
+    try:
+        data = json.loads(await read_body(receive) or b"null")
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await send_json(send, {"error": "Body phải là JSON object"}, 400)
+        return
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(_inflight.acquire(), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        record_translate_response(data, 503, started)
+        await send_json(send, {"error": "Máy chủ đang quá tải, thử lại sau"}, 503)
+        return
+
+    request_headers = dict(scope.get("headers", []))
+    timing_header = request_headers.get(b"x-server-timing", b"").decode("latin-1")
+    timings = Timings() if wants_server_timing(timing_header) else None
+
+    pending = None
+    try:
+        pending = submit_blocking(handle_translate_request, data, timings)
+        try:
+            kind, payload, status = await asyncio.wait_for(asyncio.shield(pending), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            record_translate_response(data, 504, started)
+            await send_json(send, {"error": "Quá thời gian chờ dịch"}, 504)
+            return
+        pending = None
+        record_translate_response(data, status, started, stream=kind == "stream")
+        if kind == "stream":
+            pending = await send_stream(send, payload)
+        else:
+            headers = [(b"server-timing", timings.header().encode("latin-1"))] if timings else []
+            await send_json(send, payload, status, headers)
+    finally:
+        if pending is not None and not pending.done():
+            # Luồng trong pool vẫn đang dịch: chỉ trả chỗ khi nó thật sự xong
+            pending.add_done_callback(lambda _: _inflight.release())
+        else:
+            _inflight.release()
+
+
+async def suggestions_endpoint(scope, receive, send):
+    params = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    query = params.get("q", [""])[0]
+    module_id = params.get("module_id", [""])[0] or None
+    fuzzy = params.get("fuzzy", ["1"])[0] != "0"
+
+    # get_glossary() có thể phải dựng lại từ DB: không chạy trên event loop
+    glossary = await run_blocking(get_glossary)
+    await send_json(send, glossary["suggestions"].suggest(query, module_id, limit=10, fuzzy=fuzzy))
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            upstream_executor.shutdown(wait=False)
+            wsgi_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+        return
+
+    if scope["type"] == "http":
+        path, method = scope["path"], scope["method"]
+        if path == "/api/translate" and method == "POST":
+            await translate_endpoint(scope, receive, send)
+            return
+        if path == "/api/suggestions" and method == "GET":
+            await suggestions_endpoint(scope, receive, send)
+            return
+
+    await wsgi_application(scope, receive, send)
@@ -0,0 +1,261 @@
+import queue
+import re
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+from html import escape
+from pathlib import Path
+
+
+def fold_text(text):
+    """Chuẩn hoá để tìm kiếm: chữ thường, bỏ dấu tiếng Việt (đ -> d), bỏ khoảng trắng hai đầu."""
+    text = unicodedata.normalize("NFD", (text or "").strip().lower()).replace("đ", "d")
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def _fold_chars(text):
+    # Như fold_text nhưng giữ nguyên độ dài, để vị trí khớp dùng được trên văn bản gốc
+    folded = []
+    for c in text:
+        if c in "đĐ":
+            folded.append("d")
+            continue
+        base = unicodedata.normalize("NFD", c)[0].lower()
+        folded.append(base if len(base) == 1 else c)
+    return "".join(folded)
+
+
+def register_functions(conn):
+    conn.create_function("fold", 1, fold_text, deterministic=True)
+
+
+# --- Pool kết nối: mỗi request mượn một connection chỉ đọc riêng, trả lại khi xong ---
+class ConnectionPool:
+    """Pool connection SQLite cho các luồng xử lý request.
+
+    writer() mở một connection ghi riêng khi cần (migration) và đóng ngay sau đó;
+    các connection đọc mở ở chế độ chỉ đọc nên nhiều luồng/worker đọc song song
+    mà không chặn nhau. Glossary tự phát hiện thay đổi qua bảng GlossaryVersion.
+    """
+
+    def __init__(self, path, size=8, readonly=True, mmap_size=64 * 1024 * 1024, cache_size=-16000):
+        self.path = path
+        self.size = size
+        self.readonly = readonly
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self._idle = queue.LifoQueue()
+        self._writer_lock = threading.Lock()
+        with self.writer() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")  # lưu trong file DB, chỉ cần bật một lần
+
+    def _connect(self, readonly):
+        if readonly:
+            uri = Path(self.path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        register_functions(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect(readonly=self.readonly)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            conn = self._connect(readonly=False)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+
+# --- Migration theo PRAGMA user_version; mỗi bước là một danh sách câu lệnh SQL ---
+_FTS_FOLD = "replace(replace(coalesce({row}.{col}, ''), 'đ', 'd'), 'Đ', 'D')"
+_FTS_VALUES = ", ".join(
+    _FTS_FOLD.format(row="{row}", col=col) for col in ("english", "vietnamese", "note", "boi_canh", "vi_du")
+)
+
+MIGRATIONS = [
+    # v1: dựng lại Terms với khoá chính thật và cột english_norm (chữ thường, bỏ dấu).
+    # id không phải số nguyên (dữ liệu nhập tay lỗi) được cấp id mới.
+    [
+        """CREATE TABLE Terms_new (
+            id INTEGER PRIMARY KEY,
+            english TEXT,
+            vietnamese TEXT,
+            note TEXT,
+            module TEXT,
+            boi_canh TEXT,
+            vi_du TEXT,
+            english_norm TEXT
+        )""",
+        """INSERT INTO Terms_new (id, english, vietnamese, note, module, boi_canh, vi_du, english_norm)
+            SELECT CASE WHEN typeof(id) = 'integer' THEN id END,
+                   english, vietnamese, note, module, boi_canh, vi_du, fold(english)
+            FROM Terms""",
+        "DROP TABLE Terms",
+        "ALTER TABLE Terms_new RENAME TO Terms",
+        "CREATE INDEX idx_terms_module_english ON Terms (module, english)",
+        "CREATE INDEX idx_terms_english_norm ON Terms (english_norm)",
+        "CREATE INDEX idx_terms_module_english_norm ON Terms (module, english_norm)",
+        # Công cụ ngoài (DB Browser...) không có hàm fold(): trigger dùng lower(),
+        # ensure_english_norm() chuẩn hoá lại khi app khởi động
+        """CREATE TRIGGER terms_english_norm_ai AFTER INSERT ON Terms BEGIN
+            UPDATE Terms SET english_norm = lower(trim(NEW.english)) WHERE id = NEW.id;
+        END""",
+        """CREATE TRIGGER terms_english_norm_au AFTER UPDATE OF english ON Terms BEGIN
+            UPDATE Terms SET english_norm = lower(trim(NEW.english)) WHERE id = NEW.id;
+        END""",
+    ],
+    # v2: bảng FTS5 cho english, vietnamese, note, boi_canh, vi_du, đồng bộ bằng trigger.
+    # unicode61 bỏ dấu tiếng Việt nhưng không đổi đ -> d, nên nội dung được thay đ/Đ
+    # trước khi đưa vào chỉ mục (chỉ dùng hàm SQL có sẵn để công cụ ngoài vẫn ghi được)
+    [
+        """CREATE VIRTUAL TABLE TermsFts USING fts5(
+            english, vietnamese, note, boi_canh, vi_du,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )""",
+        f"""INSERT INTO TermsFts (rowid, english, vietnamese, note, boi_canh, vi_du)
+            SELECT id, {_FTS_VALUES.format(row="Terms")} FROM Terms""",
+        f"""CREATE TRIGGER terms_fts_ai AFTER INSERT ON Terms BEGIN
+            INSERT INTO TermsFts (rowid, english, vietnamese, note, boi_canh, vi_du)
+            VALUES (NEW.id, {_FTS_VALUES.format(row="NEW")});
+        END""",
+        """CREATE TRIGGER terms_fts_ad AFTER DELETE ON Terms BEGIN
+            DELETE FROM TermsFts WHERE rowid = OLD.id;
+        END""",
+        f"""CREATE TRIGGER terms_fts_au AFTER UPDATE OF id, english, vietnamese, note, boi_canh, vi_du ON Terms BEGIN
+            DELETE FROM TermsFts WHERE rowid = OLD.id;
+            INSERT INTO TermsFts (rowid, english, vietnamese, note, boi_canh, vi_du)
+            VALUES (NEW.id, {_FTS_VALUES.format(row="NEW")});
+        END""",
+    ],
+    # v3: số phiên bản glossary, tăng mỗi khi thuật ngữ thay đổi (kể cả ghi từ công cụ ngoài).
+    # App so sánh số này để biết khi nào cần dựng lại bộ so khớp/cache thay vì đọc lại Terms
+    [
+        """CREATE TABLE GlossaryVersion (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )""",
+        "INSERT INTO GlossaryVersion (id, version, updated_at) VALUES (1, 1, datetime('now'))",
+        *(
+            f"""CREATE TRIGGER terms_glossary_version_{suffix} AFTER {event} ON Terms BEGIN
+                UPDATE GlossaryVersion SET version = version + 1, updated_at = datetime('now') WHERE id = 1;
+            END"""
+            for suffix, event in (
+                ("ai", "INSERT"),
+                ("ad", "DELETE"),
+                ("au", "UPDATE OF id, english, vietnamese, note, module"),
+            )
+        ),
+    ],
+]
+
+
+def migrate(conn):
+    register_functions(conn)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            conn.execute("BEGIN")
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    ensure_english_norm(conn)
+
+
+def get_glossary_version(conn):
+    return conn.execute("SELECT version FROM GlossaryVersion WHERE id = 1").fetchone()[0]
+
+
+def ensure_english_norm(conn):
+    # Sửa các dòng có english_norm chưa đúng chuẩn fold() (vd. thêm từ công cụ ngoài)
+    conn.execute("UPDATE Terms SET english_norm = fold(english) WHERE english_norm IS NOT fold(english)")
+    conn.commit()
+
+
+# --- Tìm kiếm toàn văn (FTS5, xếp hạng BM25) ---
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 1.0, 1.0)  # english, vietnamese, note, boi_canh, vi_du
+
+
+def search_tokens(query):
+    return re.findall(r"[^\W_]+", fold_text(query))
+
+
+def search_terms(conn, query, module_id=None, limit=50):
+    """Trả về các dòng (id, module, english, vietnamese, note, boi_canh, vi_du, score), tốt nhất trước.
+
+    Mỗi từ trong query được tìm theo tiền tố, không phân biệt hoa/thường và dấu.
+    """
+    tokens = search_tokens(query)
+    if not tokens:
+        return []
+    match = " ".join(f'"{token}"*' for token in tokens)
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    sql = f"""
+        SELECT t.id, t.module, t.english, t.vietnamese, t.note, t.boi_canh, t.vi_du,
+               bm25(TermsFts, {weights}) AS score
+        FROM TermsFts JOIN Terms t ON t.id = TermsFts.rowid
+        WHERE TermsFts MATCH ?
+    """
+    params = [match]
+    if module_id:
+        sql += " AND t.module = ?"
+        params.append(module_id)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def highlight(text, query, width=None):
+    """Escape HTML và bọc các từ khớp với query bằng <mark>.
+
+    Nếu có width và văn bản dài hơn, chỉ lấy một đoạn quanh lần khớp đầu tiên.
+    """
+    text = text or ""
+    tokens = search_tokens(query)
+    spans = []
+    if tokens:
+        pattern = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in tokens) + r")\w*")
+        spans = [m.span() for m in pattern.finditer(_fold_chars(text))]
+
+    start, end = 0, len(text)
+    if width and len(text) > width:
+        start = max(0, (spans[0][0] if spans else 0) - width // 3)
+        end = min(len(text), start + width)
+
+    parts = ["…"] if start > 0 else []
+    pos = start
+    for s, e in spans:
+        if s < pos or e > end:
+            continue
+        parts.append(escape(text[pos:s]))
+        parts.append(f"<mark>{escape(text[s:e])}</mark>")
+        pos = e
+    parts.append(escape(text[pos:end]))
+    if end < len(text):
+        parts.append("…")
+    return "".join(parts)
@@ -0,0 +1,286 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+from term_matcher import TermMatcher
+
+# --- Snapshot glossary: file bất biến, các worker mmap chung thay vì tự dựng từ SQLite ---
+# Bố cục: MAGIC | độ dài header (4 byte) | header JSON | các mảng int32 + khối chuỗi UTF-8.
+# Automaton Aho-Corasick được ghi thành mảng phẳng (chuyển trạng thái sắp xếp theo ký tự,
+# tìm bằng bisect) nên dùng trực tiếp trên vùng nhớ mmap, không phải dựng lại dict trong từng process.
+MAGIC = b"GLSNAP02"
+ALIGN = 8
+
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % ALIGN))
+
+
+def write_snapshot(path, rows, version, markups, tag=""):
+    """Ghi snapshot cho các dòng (english, vietnamese, note, module) theo thứ tự trong Terms.
+
+    markups: {tên định dạng: hàm(english, vietnamese, note, module) -> chuỗi thay cho thuật ngữ},
+    được tính sẵn một lần cho mỗi thuật ngữ ở đây. tag ghi vào header để nhận ra snapshot
+    dựng bằng các hàm markup cũ. Ghi ra file tạm rồi đổi tên, nên worker khác không bao giờ
+    đọc phải file ghi dở.
+    """
+    key_ids = {}
+    key_terms = []
+    terms = []
+    for english, vietnamese, note, module in rows:
+        key = (english or "").strip().lower()
+        if not key:
+            continue
+        k = key_ids.setdefault(key, len(key_ids))
+        if k == len(key_terms):
+            key_terms.append([])
+        key_terms[k].append(len(terms))
+        terms.append((english, vietnamese, note, str(module)))
+
+    # Chỉ mục theo module: choose[scope * K + k] = thuật ngữ dùng cho key k trong scope đó
+    # (scope 0 = mọi module), giống cách TermMatcher giữ dòng đầu tiên của mỗi key
+    modules = sorted({term[3] for term in terms})
+    module_ids = {module: i + 1 for i, module in enumerate(modules)}
+    n_keys = len(key_terms)
+    choose = array("i", [-1]) * ((len(modules) + 1) * n_keys)
+    for k, ids in enumerate(key_terms):
+        choose[k] = ids[0]
+        for t in ids:
+            slot = module_ids[terms[t][3]] * n_keys + k
+            if choose[slot] < 0:
+                choose[slot] = t
+
+    # Phiên bản từng bộ so khớp, cùng công thức với TermMatcher.version
+    matcher_versions = {}
+    for scope, module in enumerate([None] + modules):
+        digest = hashlib.sha1()
+        for t, (english, vietnamese, note, term_module) in enumerate(terms):
+            if module is not None and term_module != module:
+                continue
+            k = key_ids[english.strip().lower()]
+            if choose[scope * n_keys + k] == t:
+                digest.update(repr((english, (english, vietnamese, note))).encode("utf-8"))
+        matcher_versions["*" if module is None else module] = digest.hexdigest()
+
+    goto, fail, out = TermMatcher((key, None) for key in key_ids).tables()
+    trans_start, trans_char, trans_next = array("i", [0]), array("i"), array("i")
+    out_start, out_len, out_key = array("i", [0]), array("i"), array("i")
+    for node in range(len(goto)):
+        for ch, nxt in sorted(goto[node].items()):
+            trans_char.append(ord(ch))
+            trans_next.append(nxt)
+        trans_start.append(len(trans_char))
+        for length, k in out[node]:
+            out_len.append(length)
+            out_key.append(k)
+        out_start.append(len(out_len))
+
+    blob = bytearray()
+    str_offsets = array("i", [0])
+    markup_names = list(markups)
+    for english, vietnamese, note, module in terms:
+        values = [english, vietnamese, note, module]
+        values.extend(markups[name](english, vietnamese, note, module) for name in markup_names)
+        for value in values:
+            blob += (value or "").encode("utf-8")
+            str_offsets.append(len(blob))
+
+    sections = [
+        ("trans_start", trans_start), ("trans_char", trans_char), ("trans_next", trans_next),
+        ("fail", array("i", fail)), ("out_start", out_start), ("out_len", out_len), ("out_key", out_key),
+        ("choose", choose), ("str_offsets", str_offsets), ("blob", bytes(blob)),
+    ]
+    layout = {}
+    offset = 0
+    for name, data in sections:
+        size = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        layout[name] = [offset, size, data.typecode if isinstance(data, array) else "B"]
+        offset += size + (-size % ALIGN)
+    header = json.dumps({
+        "version": version,
+        "tag": tag,
+        "markups": markup_names,
+        "terms": len(terms),
+        "keys": n_keys,
+        "modules": modules,
+        "matcher_versions": matcher_versions,
+        "sections": layout,
+    }).encode("utf-8")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(4, "little"))
+        f.write(header)
+        _pad(f)
+        for _, data in sections:
+            f.write(data.tobytes() if isinstance(data, array) else data)
+            _pad(f)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Windows không cho ghi đè file đang được mmap: bản cùng phiên bản đã có sẵn thì dùng bản đó
+        os.remove(tmp_path)
+        if not os.path.exists(path):
+            raise
+
+
+def remove_stale_snapshots(pattern, keep):
+    # Process đang mmap bản cũ vẫn đọc được sau khi xoá (Linux); trên Windows bỏ qua file đang mở
+    for path in glob.glob(pattern):
+        if os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class GlossarySnapshot:
+    """Snapshot glossary đã mmap (chỉ đọc): danh sách thuật ngữ, bộ so khớp cho từng module, markup dựng sẵn.
+
+    term(t) trả về (english, vietnamese, note, module, {định dạng: markup}).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} không phải snapshot glossary")
+        header_len = int.from_bytes(view[len(MAGIC):len(MAGIC) + 4], "little")
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(view[start:start + header_len]))
+        base = start + header_len
+        base += -base % ALIGN
+
+        self.version = header["version"]
+        self.tag = header["tag"]
+        self.markups = header["markups"]
+        self.modules = header["modules"]
+        self.matcher_versions = header["matcher_versions"]
+        self._n_terms = header["terms"]
+        self._n_keys = header["keys"]
+        self._arrays = {}
+        for name, (offset, size, typecode) in header["sections"].items():
+            if base + offset + size > len(view):
+                raise ValueError(f"{path} bị cắt cụt")
+            self._arrays[name] = view[base + offset:base + offset + size].cast(typecode)
+        self._matchers = {}
+        self._lock = threading.Lock()
+        # Thuật ngữ hay gặp chỉ giải mã từ vùng mmap một lần
+        self.term = lru_cache(maxsize=4096)(self._term)
+
+    def __len__(self):
+        return self._n_terms
+
+    def _term(self, t):
+        offsets = self._arrays["str_offsets"]
+        blob = self._arrays["blob"]
+        stride = 4 + len(self.markups)
+        values = [
+            str(blob[offsets[i]:offsets[i + 1]], "utf-8")
+            for i in range(t * stride, (t + 1) * stride)
+        ]
+        return (*values[:4], dict(zip(self.markups, values[4:])))
+
+    def rows(self):
+        for t in range(self._n_terms):
+            yield self.term(t)[:4]
+
+    def matcher(self, module_id=None):
+        scope_key = "*" if module_id is None else str(module_id)
+        with self._lock:
+            matcher = self._matchers.get(scope_key)
+            if matcher is None:
+                if module_id is None:
+                    scope = 0
+                elif scope_key in self.modules:
+                    scope = self.modules.index(scope_key) + 1
+                else:
+                    return TermMatcher([])
+                choose = self._arrays["choose"][scope * self._n_keys:(scope + 1) * self._n_keys]
+                matcher = SnapshotMatcher(self, choose, self.matcher_versions[scope_key])
+                self._matchers[scope_key] = matcher
+            return matcher
+
+
+class _ChosenTerms:
+    # Giống TermMatcher.terms: terms[k] = (english, payload), payload = (english, vietnamese, note, module, markups)
+    def __init__(self, snapshot, choose):
+        self._snapshot = snapshot
+        self._choose = choose
+        self._len = sum(1 for t in choose if t >= 0)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, k):
+        term = self._snapshot.term(self._choose[k])
+        return term[0], term
+
+
+class SnapshotMatcher(TermMatcher):
+    """TermMatcher chạy trên automaton phẳng trong snapshot: cùng kết quả find()/find_all(), không tốn bộ nhớ riêng."""
+
+    def __init__(self, snapshot, choose, version):
+        self.whole_words = True
+        self.version = version
+        self._choose = choose
+        self._tables = snapshot._arrays
+        self.terms = _ChosenTerms(snapshot, choose)
+        # Nút gốc được ghé ở hầu hết mọi ký tự: giữ riêng bảng chuyển của nó trong một dict nhỏ
+        tables = self._tables
+        self._root = {
+            tables["trans_char"][i]: tables["trans_next"][i]
+            for i in range(tables["trans_start"][0], tables["trans_start"][1])
+        }
+
+    def find_all(self, text):
+        folded = self._fold(text)
+        tables = self._tables
+        trans_start, trans_char, trans_next = tables["trans_start"], tables["trans_char"], tables["trans_next"]
+        fail, out_start, out_len, out_key = tables["fail"], tables["out_start"], tables["out_len"], tables["out_key"]
+        choose = self._choose
+        root = self._root
+        best = {}
+        node = 0
+        for pos, ch in enumerate(folded):
+            code = ord(ch)
+            while node:
+                lo, hi = trans_start[node], trans_start[node + 1]
+                if hi - lo == 1:
+                    # Phần lớn nút trong trie chỉ có một nhánh: khỏi bisect
+                    i = lo if trans_char[lo] == code else -1
+                else:
+                    i = bisect_left(trans_char, code, lo, hi)
+                    if i == hi or trans_char[i] != code:
+                        i = -1
+                if i >= 0:
+                    node = trans_next[i]
+                    break
+                node = fail[node]
+            else:
+                node = root.get(code, 0)
+            lo, hi = out_start[node], out_start[node + 1]
+            if lo == hi:
+                continue
+            for j in range(lo, hi):
+                k = out_key[j]
+                if choose[k] < 0:
+                    continue
+                start = pos - out_len[j] + 1
+                end = pos + 1
+                if not self._on_boundary(folded, start, end):
+                    continue
+                current = best.get(start)
+                if current is None or end > current[0]:
+                    best[start] = (end, k)
+        return best
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import sqlite3
+from pathlib import Path
+
+from database import ensure_english_norm, get_glossary_version, migrate
+
+# --- Nạp thuật ngữ từ CSV vào bảng Terms ---
+# python ingest.py data.csv xuat-pdf/iot.csv xuat-pdf/kiemthu.csv
+# Đọc từng khối dòng, kiểm tra hợp lệ, gộp các file theo id (file sau thắng), rồi chỉ upsert
+# các dòng mới hoặc khác DB bằng executemany; tất cả nằm trong một transaction nên app không
+# bao giờ thấy glossary nạp dở, và chạy lại khi nguồn không đổi thì phiên bản glossary giữ nguyên.
+COLUMNS = ["id", "english", "vietnamese", "note", "module", "boi_canh", "vi_du"]
+CHUNK_SIZE = 500
+
+UPSERT_SQL = f"""
+    INSERT INTO Terms ({", ".join(COLUMNS)}) VALUES ({", ".join("?" for _ in COLUMNS)})
+    ON CONFLICT(id) DO UPDATE SET
+        {", ".join(f"{col} = excluded.{col}" for col in COLUMNS[1:])}
+    WHERE {" OR ".join(f"Terms.{col} IS NOT excluded.{col}" for col in COLUMNS[1:])}
+"""
+
+
+def parse_line(line):
+    # Các file CSV của dự án quote mọi ô và ghi mỗi thuật ngữ trên một dòng, nhưng dấu " trong
+    # nội dung thường không được nhân đôi (tức "cửa sổ lệnh"), làm csv.reader cắt sai cột.
+    # Tách theo "," khi dòng có dạng đó, còn lại để csv.reader xử lý như bình thường
+    if len(line) >= 2 and line.startswith('"') and line.endswith('"'):
+        return [value.replace('""', '"') for value in line[1:-1].split('","')]
+    return next(csv.reader([line]), [])
+
+
+def validate_row(row):
+    """Trả về (dòng đã chuẩn hoá, None) hoặc (None, lý do không hợp lệ)."""
+    if len(row) != len(COLUMNS):
+        return None, f"có {len(row)} cột, cần {len(COLUMNS)}"
+    values = [value.strip() for value in row]
+    if not values[0].isdigit():
+        return None, f"id không phải số nguyên: {values[0]!r}"
+    for col in ("english", "vietnamese", "module"):
+        if not values[COLUMNS.index(col)]:
+            return None, f"thiếu {col}"
+    values[0] = int(values[0])
+    # Ô trống được lưu là NULL như khi nhập tay trong DB
+    return [value if value != "" else None for value in values], None
+
+
+def iter_chunks(path, chunk_size=CHUNK_SIZE):
+    """Đọc CSV (có hoặc không có dòng tiêu đề) theo từng dòng, gom thành khối.
+
+    Sinh (danh sách dòng hợp lệ, danh sách (số dòng, lý do) không hợp lệ) cho mỗi khối.
+    """
+    with open(path, encoding="utf-8-sig") as f:
+        chunk, errors = [], []
+        for line_num, line in enumerate(f, start=1):
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            row = parse_line(line)
+            if line_num == 1 and [value.strip().lower() for value in row] == COLUMNS:
+                continue
+            values, error = validate_row(row)
+            if error:
+                errors.append((line_num, error))
+            else:
+                chunk.append(values)
+            if len(chunk) >= chunk_size:
+                yield chunk, errors
+                chunk, errors = [], []
+        if chunk or errors:
+            yield chunk, errors
+
+
+def read_files(paths, chunk_size=CHUNK_SIZE):
+    """Đọc các file CSV và gộp theo id, file sau thắng file trước.
+
+    Trả về (dict id -> dòng hợp lệ, thống kê từng file). Mỗi id chỉ được ghi một lần,
+    nên các file trùng id (data.csv và kiemthu.csv) không làm DB bị ghi đi ghi lại.
+    """
+    merged = {}
+    source = {}
+    report = {}
+    for path in paths:
+        stats = {"rows": 0, "overridden": 0, "invalid": []}
+        report[path] = stats
+        for chunk, errors in iter_chunks(path, chunk_size):
+            stats["invalid"].extend(errors)
+            stats["rows"] += len(chunk) + len(errors)
+            for row in chunk:
+                previous = source.get(row[0])
+                if previous is not None and previous != path:
+                    report[previous]["overridden"] += 1
+                merged[row[0]] = row
+                source[row[0]] = path
+    return merged, report
+
+
+def _same(db_row, row):
+    # So như SQLite so sau khi áp kiểu cột (module 10 và "10" là một)
+    return all(
+        (a is None and b is None) or (a is not None and b is not None and str(a) == str(b))
+        for a, b in zip(db_row, row)
+    )
+
+
+def diff_rows(conn, rows):
+    """Chia các dòng thành (dòng mới, dòng khác DB); dòng giống hệt DB bị bỏ qua."""
+    has_terms = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Terms'").fetchone()
+    existing = {}
+    if has_terms:
+        ids = [row[0] for row in rows]
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            sql = f"SELECT {', '.join(COLUMNS)} FROM Terms WHERE id IN ({', '.join('?' for _ in part)})"
+            existing.update((db_row[0], db_row) for db_row in conn.execute(sql, part))
+    inserted = [row for row in rows if row[0] not in existing]
+    updated = [row for row in rows if row[0] in existing and not _same(existing[row[0]], row)]
+    return inserted, updated
+
+
+def ingest(conn, paths, chunk_size=CHUNK_SIZE, dry_run=False):
+    """Nạp các file CSV vào Terms trong một transaction.
+
+    Trả về (thống kê từng file, tổng số dòng thêm/cập nhật/không đổi). dry_run chỉ đọc DB.
+    """
+    merged, report = read_files(paths, chunk_size)
+    rows = list(merged.values())
+    if not dry_run:
+        conn.execute("BEGIN")
+    try:
+        inserted, updated = diff_rows(conn, rows)
+        if not dry_run:
+            changed = inserted + updated
+            for i in range(0, len(changed), chunk_size):
+                conn.executemany(UPSERT_SQL, changed[i:i + chunk_size])
+            conn.commit()
+    except (OSError, sqlite3.Error):
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    totals = {"inserted": len(inserted), "updated": len(updated), "unchanged": len(rows) - len(inserted) - len(updated)}
+    return report, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nạp thuật ngữ từ CSV vào bảng Terms (upsert theo id).")
+    parser.add_argument("csv_files", nargs="+", help="các file CSV, file sau ghi đè file trước nếu trùng id")
+    parser.add_argument("--db", default="database1.db", help="file SQLite (mặc định: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="số dòng mỗi lần executemany")
+    parser.add_argument("--dry-run", action="store_true", help="chỉ kiểm tra và thống kê, không ghi")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        # Mở chỉ đọc: không migration, không sửa english_norm, không tạo file DB mới
+        conn = sqlite3.connect(Path(args.db).resolve().as_uri() + "?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.dry_run:
+            report, totals = ingest(conn, args.csv_files, args.chunk_size, dry_run=True)
+        else:
+            migrate(conn)
+            before = get_glossary_version(conn)
+            report, totals = ingest(conn, args.csv_files, args.chunk_size)
+            ensure_english_norm(conn)
+            after = get_glossary_version(conn)
+    finally:
+        conn.close()
+
+    for path, stats in report.items():
+        print(f"{path}: {stats['rows']} dòng, {stats['overridden']} bị file sau ghi đè, lỗi {len(stats['invalid'])}")
+        for line_num, error in stats["invalid"][:10]:
+            print(f"  - dòng {line_num}: {error}")
+        if len(stats["invalid"]) > 10:
+            print(f"  ... và {len(stats['invalid']) - 10} dòng lỗi khác")
+    print(f"Tổng: thêm {totals['inserted']}, cập nhật {totals['updated']}, không đổi {totals['unchanged']}")
+    if args.dry_run:
+        print("Chạy thử (--dry-run): không ghi gì vào DB.")
+    else:
+        print(f"Phiên bản glossary: {before} -> {after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Gộp các lời gọi trùng khoá đang chạy đồng thời thành một.
+
+    Luồng đầu tiên gọi do(key, fn) thực sự chạy fn; các luồng đến sau với cùng
+    key trong lúc đó chỉ chờ và nhận lại cùng kết quả (hoặc cùng exception).
+    Khi lời gọi xong, key được xoá: lần gọi sau sẽ chạy lại (kết quả lâu dài do cache lo).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            return {"inflight": len(self._calls), "calls": self.leaders, "coalesced": self.coalesced}
@@ -1,12 +1,103 @@
-(async () => {
-  const text = document.body.innerText;
+const API_URL = "https://du-an-dich-tieng-anh-chuyen-nganh-6.onrender.com/api/translate";
+const SKIP_TAGS = ["SCRIPT", "STYLE", "NOSCRIPT", "TEXTAREA", "CODE", "PRE"];
+const SEGMENTS_PER_REQUEST = 500;
+
+const isVisible = element =>
+  element.checkVisibility ? element.checkVisibility() : element.getClientRects().length > 0;
 
-  const response = await fetch("https://du-an-dich-tieng-anh-chuyen-nganh-6.onrender.com/", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ text })
+(async () => {
+  // Lấy các text node đang hiển thị và có chữ cái, bỏ qua script/style/ẩn
+  const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT, {
+    acceptNode(node) {
+      const parent = node.parentElement;
+      if (!parent || SKIP_TAGS.includes(parent.tagName) || !/[A-Za-z]/.test(node.nodeValue)) {
+        return NodeFilter.FILTER_REJECT;
+      }
+      return isVisible(parent) ? NodeFilter.FILTER_ACCEPT : NodeFilter.FILTER_REJECT;
+    }
   });
 
-  const data = await response.json();
-  document.body.innerHTML = data.translated_text;
+  // Gộp các node có cùng nội dung (menu, nút bấm...) dưới một id để chỉ dịch một lần
+  const idsByText = new Map();
+  const nodesById = [];
+  const segments = [];
+  while (walker.nextNode()) {
+    const node = walker.currentNode;
+    const text = node.nodeValue.replace(/\s+/g, " ").trim();
+    let id = idsByText.get(text);
+    if (id === undefined) {
+      id = segments.length;
+      idsByText.set(text, id);
+      segments.push({ id, text });
+      nodesById.push([]);
+    }
+    nodesById[id].push(node);
+  }
+  if (!segments.length) return;
+
+  // Dựng node từ văn bản thuần + danh sách span thuật ngữ (format "json"), không dùng innerHTML:
+  // chữ trên trang (kể cả chuỗi trông như thẻ HTML) luôn chỉ là text.
+  // start/end của server tính theo code point nên cắt trên mảng ký tự, không phải UTF-16
+  const buildTranslation = (content, spans) => {
+    const chars = Array.from(content);
+    const fragment = document.createDocumentFragment();
+    let last = 0;
+    for (const { start, end, english, note } of spans || []) {
+      fragment.append(chars.slice(last, start).join(""));
+      const term = document.createElement("span");
+      term.dataset.bsToggle = "tooltip";
+      term.title = note ? `${english} - ${note}` : english;
+      const bold = document.createElement("b");
+      bold.textContent = chars.slice(start, end).join("");
+      term.append(bold);
+      fragment.append(term);
+      last = end;
+    }
+    fragment.append(chars.slice(last).join(""));
+    return fragment;
+  };
+
+  const applyTranslation = ({ id, content, spans }) => {
+    if (content === undefined || !nodesById[id]) return;
+    for (const node of nodesById[id]) {
+      const span = document.createElement("span");
+      const lead = /^\s/.test(node.nodeValue) ? " " : "";
+      const trail = /\s$/.test(node.nodeValue) ? " " : "";
+      span.append(lead, buildTranslation(content, spans), trail);
+      node.replaceWith(span);
+    }
+    delete nodesById[id];
+  };
+
+  // Mỗi yêu cầu nhận kết quả dạng NDJSON, thay từng node ngay khi đoạn của nó dịch xong
+  const translateSegments = async batch => {
+    const response = await fetch(API_URL, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ segments: batch, stream: true, format: "json" })
+    });
+    if (!response.ok) {
+      console.error("Lỗi khi dịch trang:", response.status);
+      return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let newline;
+      while ((newline = buffer.indexOf("\n")) >= 0) {
+        const line = buffer.slice(0, newline);
+        buffer = buffer.slice(newline + 1);
+        if (line.trim()) applyTranslation(JSON.parse(line));
+      }
+    }
+  };
+
+  for (let i = 0; i < segments.length; i += SEGMENTS_PER_REQUEST) {
+    await translateSegments(segments.slice(i, i + SEGMENTS_PER_REQUEST));
+  }
 })();
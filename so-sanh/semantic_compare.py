@@ -1,14 +1,75 @@
+import hashlib
+import os
+
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
-from tqdm import tqdm
+import torch
+from sentence_transformers import SentenceTransformer
 
 # === CẤU HÌNH ===
 INPUT_FILE = "api_google_group_comparison.xlsx"   # phải có cột 'Google' và 'My API'
 OUTPUT_FILE = "ketqua_semantic.xlsx"
+MODEL_NAME = "keepitreal/vietnamese-sbert"
+BATCH_SIZE = int(os.environ.get("SEMANTIC_BATCH_SIZE", 64))          # số câu mỗi lần encode
+WORKERS = int(os.environ.get("SEMANTIC_WORKERS", os.cpu_count() or 1))  # số luồng CPU cho torch
+EMBEDDING_CACHE = os.environ.get("SEMANTIC_EMBEDDING_CACHE", "embeddings_cache.npz")
 
-# === TẢI MÔ HÌNH NGÔN NGỮ ===
+# === TẢI MÔ HÌNH NGÔN NGỮ (chỉ dùng CPU) ===
 print("🔹 Đang tải mô hình ngôn ngữ ...")
-model = SentenceTransformer("keepitreal/vietnamese-sbert")
+torch.set_num_threads(WORKERS)
+model = SentenceTransformer(MODEL_NAME, device="cpu")
+
+
+# === CACHE EMBEDDING TRÊN ĐĨA: câu đã encode ở lần chạy trước không phải encode lại ===
+def text_key(text):
+    return hashlib.sha1(f"{MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
+
+
+def load_embedding_cache(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        data = np.load(path)
+        return dict(zip(data["keys"].tolist(), data["vectors"]))
+    except Exception as e:
+        print(f"⚠️ Không đọc được cache embedding {path}: {e}")
+        return {}
+
+
+def save_embedding_cache(path, cache):
+    if not cache:
+        return
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, keys=np.array(list(cache)), vectors=np.stack(list(cache.values())))
+    os.replace(tmp_path, path)
+
+
+def encode_all(texts, cache):
+    """Encode các câu khác nhau theo lô lớn (bỏ trùng, bỏ câu đã có trong cache).
+
+    Trả về ma trận embedding đã chuẩn hoá độ dài, mỗi dòng ứng với một phần tử của texts.
+    """
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    keys = [text_key(text) for text in texts]
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cache:
+            missing.setdefault(key, text)
+
+    if missing:
+        print(f"🔹 Encode {len(missing)} câu mới ({len(set(keys)) - len(missing)} câu lấy từ cache)...")
+        vectors = model.encode(
+            list(missing.values()),
+            batch_size=BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=True
+        )
+        cache.update(zip(missing, vectors.astype(np.float32)))
+
+    return np.stack([cache[key] for key in keys])
 
 # === ĐỌC FILE ===
 df = pd.read_excel(INPUT_FILE)
@@ -17,21 +78,23 @@ df = pd.read_excel(INPUT_FILE)
 if not {'Google', 'My API'}.issubset(df.columns):
     raise Exception("⚠️ File phải có cột: 'Kết quả Google' và 'Kết quả My API'")
 
-scores = []
-
-# === TÍNH SIMILARITY TỪNG DÒNG ===
+# === TÍNH SIMILARITY: encode theo lô rồi tính cosine cho mọi dòng cùng lúc ===
 print("🔍 Đang so sánh ngữ nghĩa...")
-for g, m in tqdm(zip(df['Google'], df['My API']), total=len(df)):
-    if pd.isna(g) or pd.isna(m):
-        scores.append(None)
-        continue
+valid_rows = df['Google'].notna() & df['My API'].notna()
+google_texts = df.loc[valid_rows, 'Google'].astype(str).tolist()
+my_api_texts = df.loc[valid_rows, 'My API'].astype(str).tolist()
+
+embedding_cache = load_embedding_cache(EMBEDDING_CACHE)
+embeddings = encode_all(google_texts + my_api_texts, embedding_cache)
+save_embedding_cache(EMBEDDING_CACHE, embedding_cache)
 
-    emb1 = model.encode(str(g), convert_to_tensor=True)
-    emb2 = model.encode(str(m), convert_to_tensor=True)
-    similarity = util.cos_sim(emb1, emb2).item()
-    scores.append(round(similarity * 100, 2))  # đổi sang %
+# Embedding đã chuẩn hoá nên cosine = tích vô hướng từng cặp dòng
+google_emb, my_api_emb = embeddings[:len(google_texts)], embeddings[len(google_texts):]
+similarity = np.einsum("ij,ij->i", google_emb, my_api_emb)
 
-df['Độ tương đồng (%)'] = scores
+scores = pd.Series(None, index=df.index, dtype=object)
+scores[valid_rows] = np.round(similarity * 100, 2)  # đổi sang %
+df['Độ tương đồng (%)'] = pd.to_numeric(scores)
 
 # === ĐÁNH GIÁ SƠ BỘ ===
 def rank(score):
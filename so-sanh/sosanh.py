@@ -1,42 +1,154 @@
 import pandas as pd
 import requests
 import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import deep_translator.google
 from deep_translator import GoogleTranslator
-from bs4 import BeautifulSoup
+from deep_translator.exceptions import RequestError, TooManyRequests
+from requests.adapters import HTTPAdapter
 import time
 
 # ---------------------------------------------------------------------------
 # BƯỚC 1: CẤU HÌNH API CỦA BẠN
 # ---------------------------------------------------------------------------
-MY_API_URL = "https://apidichtienganh.onrender.com/api/translate"
+# Chạy với app.py local: SOSANH_API_URL=http://localhost:5000/api/translate
+# Không gọi Google (chạy thử/offline): SOSANH_GOOGLE=stub
+MY_API_URL = os.environ.get("SOSANH_API_URL", "https://apidichtienganh.onrender.com/api/translate")
 MY_API_HEADERS = {"Content-Type": "application/json"}  # header chuẩn JSON
+GOOGLE_MODE = os.environ.get("SOSANH_GOOGLE", "google")
+
+WORKERS = int(os.environ.get("SOSANH_WORKERS", 8))             # số request chạy song song
+BATCH_SIZE = int(os.environ.get("SOSANH_BATCH_SIZE", 50))      # số thuật ngữ mỗi lần gọi My API
+MY_API_RATE = float(os.environ.get("SOSANH_API_RATE", 10))     # request/giây tới My API
+GOOGLE_RATE = float(os.environ.get("SOSANH_GOOGLE_RATE", 20))   # request/giây tới Google
+MAX_RETRIES = int(os.environ.get("SOSANH_RETRIES", 3))
+TIMEOUT = float(os.environ.get("SOSANH_TIMEOUT", 30))
 
 # ---------------------------------------------------------------------------
 # BƯỚC 2: CÁC HÀM HỖ TRỢ
 # ---------------------------------------------------------------------------
+class TokenBucket:
+    """Giới hạn tốc độ: tối đa `rate` lần/giây, cho phép dồn tối đa `capacity` lần."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RetryableError(Exception):
+    pass
+
+
+def with_retry(bucket, func, *args):
+    # Thử lại khi lỗi mạng / HTTP 429, 5xx, chờ tăng dần (1s, 2s, 4s... + ngẫu nhiên)
+    for attempt in range(MAX_RETRIES + 1):
+        bucket.acquire()
+        try:
+            return func(*args)
+        except (requests.RequestException, RetryableError):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(2 ** attempt + random.random())
+
+
+# Một Session dùng chung: giữ kết nối keep-alive thay vì bắt tay TCP/TLS cho mỗi thuật ngữ
+session = requests.Session()
+session.headers.update(MY_API_HEADERS)
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS))
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS))
+
+# deep_translator.google gọi thẳng requests.get (không Session, không timeout): thay biến requests
+# của module đó bằng lớp dưới đây để lời gọi Google cũng dùng lại kết nối và có hạn TIMEOUT
+google_session = requests.Session()
+google_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS))
+
+
+class _GoogleHTTP:
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", TIMEOUT)
+        return google_session.get(url, **kwargs)
+
+
+deep_translator.google.requests = _GoogleHTTP()
+
+my_api_bucket = TokenBucket(MY_API_RATE)
+google_bucket = TokenBucket(GOOGLE_RATE)
+# GoogleTranslator ghi tham số request vào chính nó: mỗi luồng một instance
+_google_local = threading.local()
+
+
+def _google_translator():
+    translator = getattr(_google_local, "translator", None)
+    if translator is None:
+        translator = _google_local.translator = GoogleTranslator(source='en', target='vi')
+    return translator
+
+
+def _google(term):
+    # Lỗi mạng (requests.RequestException) được with_retry thử lại. deep_translator báo 429 bằng
+    # TooManyRequests và các status lỗi khác bằng RequestError (đầu vào sai đã bị chặn trước khi
+    # gửi, nên thực tế là 5xx); mọi lỗi khác (không tìm thấy bản dịch...) báo ngay, không thử lại
+    try:
+        return _google_translator().translate(term)
+    except (TooManyRequests, RequestError) as e:
+        raise RetryableError(e)
+
 def translate_with_google(term):
+    if GOOGLE_MODE == "stub":
+        return term  # giữ nguyên thuật ngữ, không gọi mạng
     try:
-        return GoogleTranslator(source='en', target='vi').translate(term)
+        return with_retry(google_bucket, _google, term)
     except Exception as e:
         return f"Lỗi Google ({e})"
 
-def translate_with_my_api(term):
-    payload = {"texts": [term]}  # API yêu cầu mảng "texts"
+def _post_batch(terms):
+    response = session.post(MY_API_URL, json={"texts": terms, "format": "json"}, timeout=TIMEOUT)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(f"HTTP {response.status_code}")
+    return response
+
+def translate_batch_with_my_api(terms):
+    """Dịch một lô thuật ngữ bằng một request; trả về danh sách văn bản thuần cùng thứ tự.
+
+    format=json: API trả văn bản thuần (thuật ngữ glossary nằm trong "spans"), không phải bóc HTML.
+    """
     try:
-        response = requests.post(MY_API_URL, headers=MY_API_HEADERS, json=payload, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            translations = data.get("translations", [])
-            if translations and "content" in translations[0]:
-                return translations[0]["content"]
-            return "lỗi API"
-        return f"Lỗi HTTP {response.status_code}"
+        response = with_retry(my_api_bucket, _post_batch, terms)
     except Exception as e:
-        return f"Lỗi kết nối ({e})"
-
-def extract_text_from_html(html_content):
-    """Lấy text thuần từ HTML"""
-    return BeautifulSoup(html_content, "html.parser").get_text()
+        return [f"Lỗi kết nối ({e})"] * len(terms)
+    if response.status_code != 200:
+        return [f"Lỗi HTTP {response.status_code}"] * len(terms)
+    translations = response.json().get("translations", [])
+    if len(translations) != len(terms):
+        return ["lỗi API"] * len(terms)
+    return [item.get("content", "lỗi API") for item in translations]
+
+def translate_all(terms):
+    """Dịch song song toàn bộ thuật ngữ bằng cả hai bên: My API theo lô, Google từng thuật ngữ."""
+    batches = [terms[i:i + BATCH_SIZE] for i in range(0, len(terms), BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        google_results = executor.map(translate_with_google, terms)
+        my_api_results = executor.map(translate_batch_with_my_api, batches)
+        google_trans = list(google_results)
+        my_api_trans = [content for batch in my_api_results for content in batch]
+    return my_api_trans, google_trans
 
 def load_test_corpus(filename):
     if not os.path.exists(filename):
@@ -59,8 +171,16 @@ def run_comparison_by_group():
     all_results = []
     group_stats = {}  # để thống kê %
 
-    for group_name, filename in groups_to_test.items():
-        terms = load_test_corpus(filename)
+    corpus = {group_name: load_test_corpus(filename) for group_name, filename in groups_to_test.items()}
+    # Dịch toàn bộ các nhóm trong một lượt song song (trùng thuật ngữ giữa các nhóm chỉ dịch một lần)
+    unique_terms = list(dict.fromkeys(term for terms in corpus.values() for term in terms))
+    started = time.perf_counter()
+    my_api_all, google_all = translate_all(unique_terms)
+    my_api_by_term = dict(zip(unique_terms, my_api_all))
+    google_by_term = dict(zip(unique_terms, google_all))
+    print(f"⏱ Đã dịch {len(unique_terms)} thuật ngữ trong {time.perf_counter() - started:.1f}s")
+
+    for group_name, terms in corpus.items():
         if not terms:
             continue
 
@@ -68,9 +188,8 @@ def run_comparison_by_group():
         match_count = 0
 
         for term in terms:
-            my_api_html = translate_with_my_api(term)
-            my_api_text = extract_text_from_html(my_api_html).strip()
-            google_trans = translate_with_google(term).strip()
+            my_api_text = my_api_by_term[term].strip()
+            google_trans = google_by_term[term].strip()
 
             is_match = my_api_text.lower() == google_trans.lower()
             if is_match:
@@ -91,8 +210,6 @@ def run_comparison_by_group():
         group_stats[group_name] = accuracy
         print(f"📊 Độ chính xác nhóm này: {accuracy}% ({match_count}/{len(terms)})")
 
-        time.sleep(1)  # nghỉ nhẹ để tránh spam
-
     return pd.DataFrame(all_results), group_stats
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,144 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from database import fold_text
+
+
+class SuggestionIndex:
+    """Chỉ mục gợi ý trong bộ nhớ: mảng đã sắp xếp + bisect, dựng một lần từ Terms.
+
+    Hỗ trợ tìm theo tiền tố (không phân biệt hoa/thường và dấu) ở cả phía tiếng
+    Anh lẫn tiếng Việt, và tìm gần đúng theo tiền tố (khoảng cách sửa 1-2).
+    """
+
+    def __init__(self, rows, cache_size=1024):
+        # rows: (english, vietnamese, module)
+        self.english = self._build((english, module) for english, _, module in rows)
+        self.vietnamese = self._build((vietnamese, module) for _, vietnamese, module in rows)
+        # Các tiền tố gõ nhiều lần (nhiều người dùng cùng gõ) trả về ngay từ cache
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build(items):
+        entries = {}
+        for display, module in items:
+            key = fold_text(display)
+            if not key:
+                continue
+            entry = entries.setdefault((key, display.strip()), set())
+            entry.add(str(module))
+        ordered = sorted(entries.items())
+        keys = [key for (key, _), _ in ordered]
+        values = [(display, frozenset(modules)) for (_, display), modules in ordered]
+        return keys, values
+
+    def suggest(self, query, module_id=None, limit=10, fuzzy=True):
+        q = fold_text(query)
+        if not q:
+            return []
+
+        key = (q, str(module_id) if module_id else None, limit, fuzzy)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return list(self._cache[key])
+
+        results = self._suggest(q, key[1], limit, fuzzy)
+        with self._lock:
+            self._cache[key] = results
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return list(results)
+
+    def _suggest(self, q, module_id, limit, fuzzy):
+        results = []
+        seen = set()
+
+        def collect(values, indexes):
+            for i in indexes:
+                display, modules = values[i]
+                if module_id and module_id not in modules:
+                    continue
+                if display in seen:
+                    continue
+                seen.add(display)
+                results.append(display)
+                if len(results) >= limit:
+                    return True
+            return False
+
+        for keys, values in (self.english, self.vietnamese):
+            if collect(values, self._prefix(keys, q)):
+                return results
+
+        if fuzzy and len(q) >= 3:
+            max_distance = 1 if len(q) < 6 else 2
+            for keys, values in (self.english, self.vietnamese):
+                # Lỗi gõ hiếm khi ở chữ cái đầu: chỉ duyệt khối key cùng chữ cái đầu với q
+                lo = bisect_left(keys, q[0])
+                hi = bisect_left(keys, q[0] + "\U0010ffff", lo)
+                matches = sorted(self._fuzzy_prefix(keys, q, max_distance, lo, hi))
+                if collect(values, (i for _, i in matches)):
+                    return results
+
+        return results
+
+    @staticmethod
+    def _prefix(keys, q):
+        i = bisect_left(keys, q)
+        while i < len(keys) and keys[i].startswith(q):
+            yield i
+            i += 1
+
+    @staticmethod
+    def _fuzzy_prefix(keys, q, max_distance, lo=0, hi=None):
+        """Trả về (khoảng cách, vị trí) của các key trong keys[lo:hi] có một tiền tố cách q không quá max_distance.
+
+        Duyệt mảng đã sắp xếp như duyệt trie: dùng lại các hàng quy hoạch động của
+        phần tiền tố chung với key trước, và nhảy qua cả khối key khi tiền tố đã
+        chắc chắn không thể khớp.
+        """
+        n = len(q)
+        rows = [list(range(n + 1))]   # rows[d][j] = khoảng cách giữa key[:d] và q[:j]
+        best = [n]                    # best[d] = min(rows[0..d][n])
+        prev = ""
+        matches = []
+        hi = len(keys) if hi is None else hi
+        i = lo
+        while i < hi:
+            key = keys[i]
+            lcp = 0
+            bound = min(len(prev), len(key), len(rows) - 1)
+            while lcp < bound and prev[lcp] == key[lcp]:
+                lcp += 1
+            del rows[lcp + 1:]
+            del best[lcp + 1:]
+            prev = key
+
+            skipped = False
+            for d in range(lcp, len(key)):
+                above = rows[d]
+                ch = key[d]
+                row = [above[0] + 1]
+                for j in range(1, n + 1):
+                    row.append(min(row[j - 1] + 1, above[j] + 1, above[j - 1] + (q[j - 1] != ch)))
+                rows.append(row)
+                best.append(min(best[d], row[n]))
+                if min(row) > max_distance:
+                    # Đi sâu hơn không thể giảm khoảng cách: mọi key bắt đầu bằng
+                    # key[:d + 1] có cùng kết quả, xử lý cả khối rồi nhảy qua
+                    end = bisect_left(keys, key[:d + 1] + "\U0010ffff", i + 1, hi)
+                    if best[-1] <= max_distance:
+                        matches.extend((best[-1], j) for j in range(i, end))
+                    i = end
+                    skipped = True
+                    break
+            if skipped:
+                continue
+            if best[-1] <= max_distance:
+                matches.append((best[-1], i))
+            i += 1
+        return matches
@@ -0,0 +1,122 @@
+import hashlib
+from collections import deque
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class TermMatcher:
+    """Bộ so khớp nhiều mẫu (Aho-Corasick) cho các thuật ngữ trong bảng Terms.
+
+    Dựng một lần từ danh sách thuật ngữ, sau đó tìm tất cả các lần xuất hiện
+    dài nhất, không chồng lấn chỉ với một lượt duyệt qua văn bản. Mặc định chỉ
+    nhận match nằm trọn trong ranh giới từ (như \\b của regex), nên "ksh" không
+    khớp bên trong một từ khác.
+    """
+
+    def __init__(self, terms, whole_words=True):
+        self.whole_words = whole_words
+        # terms: danh sách (english, payload); payload được trả lại khi khớp
+        self.terms = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        seen = set()
+        digest = hashlib.sha1()
+
+        for english, payload in terms:
+            key = (english or "").strip().lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            self._add(key, len(self.terms))
+            self.terms.append((english, payload))
+            digest.update(repr((english, payload)).encode("utf-8"))
+
+        # Phiên bản theo nội dung: chỉ đổi khi thuật ngữ của bộ so khớp này thay đổi
+        self.version = digest.hexdigest()
+        self._build()
+
+    def __len__(self):
+        return len(self.terms)
+
+    def tables(self):
+        """Trả về (goto, fail, out) của automaton, để ghi ra dạng mảng phẳng (xem glossary_snapshot)."""
+        return self._goto, self._fail, self._out
+
+    def _add(self, key, index):
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(key), index))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Gộp output của nút fail để không phải lần theo chuỗi khi quét
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _fold(self, text):
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        # Một số ký tự Unicode đổi độ dài khi lower(); giữ nguyên để offset khớp
+        return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+    def _on_boundary(self, text, start, end):
+        # Chỉ kiểm tra ranh giới ở đầu/cuối thuật ngữ là ký tự chữ, giống \b
+        if start > 0 and _is_word_char(text[start]) and _is_word_char(text[start - 1]):
+            return False
+        if end < len(text) and _is_word_char(text[end - 1]) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def find_all(self, text):
+        """Trả về {start: (end, index)} với match dài nhất bắt đầu tại mỗi vị trí."""
+        folded = self._fold(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        whole_words = self.whole_words
+        best = {}
+        node = 0
+        for pos, ch in enumerate(folded):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, index in out[node]:
+                start = pos - length + 1
+                end = pos + 1
+                if whole_words and not self._on_boundary(folded, start, end):
+                    continue
+                current = best.get(start)
+                if current is None or end > current[0]:
+                    best[start] = (end, index)
+        return best
+
+    def find(self, text):
+        """Trả về danh sách (start, end, index, payload), dài nhất và không chồng lấn."""
+        best = self.find_all(text)
+        matches = []
+        cursor = 0
+        for start in sorted(best):
+            if start < cursor:
+                continue
+            end, index = best[start]
+            matches.append((start, end, index, self.terms[index][1]))
+            cursor = end
+        return matches
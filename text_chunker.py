@@ -0,0 +1,79 @@
+import re
+
+PLACEHOLDER_RE = re.compile(r"\[\[\s*TERM\s*\d+\s*\]\]", re.IGNORECASE)
+# Ranh giới đoạn (xuống dòng) hoặc câu (dấu kết câu + khoảng trắng)
+BOUNDARY_RE = re.compile(r"\n\s*|(?<=[.!?…;:])\s+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _split_after(text, pattern):
+    pieces = []
+    start = 0
+    for m in pattern.finditer(text):
+        if m.end() > start:
+            pieces.append(text[start:m.end()])
+            start = m.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def _hard_split(text, max_chars):
+    # Cắt cứng một "từ" quá dài nhưng không bao giờ cắt ngang placeholder [[TERMn]]
+    spans = [m.span() for m in PLACEHOLDER_RE.finditer(text)]
+    pieces = []
+    start = 0
+    while len(text) - start > max_chars:
+        cut = start + max_chars
+        for s, e in spans:
+            if s < cut < e:
+                cut = s if s > start else e
+                break
+        pieces.append(text[start:cut])
+        start = cut
+    pieces.append(text[start:])
+    return pieces
+
+
+def _units(text, max_chars):
+    units = []
+    for sentence in _split_after(text, BOUNDARY_RE):
+        if len(sentence) <= max_chars:
+            units.append(sentence)
+            continue
+        for word in _split_after(sentence, WHITESPACE_RE):
+            if len(word) <= max_chars:
+                units.append(word)
+            else:
+                units.extend(_hard_split(word, max_chars))
+    return units
+
+
+def split_chunks(text, max_chars=2000):
+    """Chia văn bản thành các chunk <= max_chars theo ranh giới đoạn/câu.
+
+    Ghép lại các chunk theo thứ tự sẽ được đúng văn bản ban đầu.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    current = ""
+    for unit in _units(text, max_chars):
+        if current and len(current) + len(unit) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def strip_edges(text):
+    """Tách khoảng trắng đầu/cuối (translator thường làm mất chúng) để ghép lại sau khi dịch."""
+    core = text.strip()
+    if not core:
+        return text, "", ""
+    lead = text[:len(text) - len(text.lstrip())]
+    trail = text[len(text.rstrip()):]
+    return lead, core, trail
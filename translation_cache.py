@@ -0,0 +1,150 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TranslationCache:
+    """Cache hai tầng cho văn bản (đã thay placeholder) gửi tới translator.
+
+    Tầng 1 là LRU trong bộ nhớ có giới hạn kích thước và TTL, tầng 2 là một file
+    SQLite để giữ kết quả qua các lần khởi động lại; TTL áp dụng cho cả hai tầng và
+    file SQLite giữ tối đa max_disk_rows mục mới nhất. Mỗi mục gắn với phạm vi
+    (module) và phiên bản glossary của phạm vi đó; khi phiên bản đổi, các mục
+    cũ của phạm vi bị xoá ở cả hai tầng.
+    """
+
+    PRUNE_EVERY = 256  # số lần put giữa hai lần cắt bớt file SQLite về max_disk_rows
+
+    def __init__(self, path, max_size=2048, ttl=3600, max_disk_rows=100000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_disk_rows = max_disk_rows
+        self._puts = 0
+        self._memory = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS TranslationCache (
+                    key TEXT PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    translated TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_cache_scope ON TranslationCache (scope, version)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_cache_created ON TranslationCache (created_at)")
+            self._prune()
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Lỗi khi mở cache dịch ({path}), chỉ dùng cache trong bộ nhớ: {e}")
+            self._db = None
+
+    @staticmethod
+    def _key(text, scope, version):
+        return hashlib.sha256(f"{scope}\0{version}\0{text}".encode("utf-8")).hexdigest()
+
+    def _check_version(self, scope, version):
+        # Gọi khi đang giữ self._lock
+        if self._versions.get(scope) == version:
+            return
+        self._versions[scope] = version
+        for key in [k for k, (s, _, _) in self._memory.items() if s == scope]:
+            del self._memory[key]
+        if self._db is not None:
+            try:
+                self._db.execute("DELETE FROM TranslationCache WHERE scope = ? AND version != ?", (scope, version))
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Lỗi SQL khi xoá cache dịch cũ: {e}")
+
+    def get(self, text, scope, version):
+        key = self._key(text, scope, version)
+        with self._lock:
+            self._check_version(scope, version)
+            entry = self._memory.get(key)
+            if entry is not None:
+                _, translated, created_at = entry
+                if time.time() - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return translated
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT translated, created_at FROM TranslationCache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and time.time() - row[1] > self.ttl:
+                        self._db.execute("DELETE FROM TranslationCache WHERE key = ?", (key,))
+                        self._db.commit()
+                        row = None
+                except sqlite3.Error as e:
+                    print(f"Lỗi SQL khi đọc cache dịch: {e}")
+                    row = None
+                if row is not None:
+                    # Giữ thời điểm tạo gốc: mục nạp lại từ đĩa không được sống thêm một TTL nữa
+                    self._remember(key, scope, row[0], created_at=row[1])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, text, scope, version, translated):
+        key = self._key(text, scope, version)
+        with self._lock:
+            self._check_version(scope, version)
+            self._remember(key, scope, translated)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO TranslationCache (key, scope, version, translated, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (key, scope, version, translated, time.time())
+                    )
+                    self._puts += 1
+                    self._prune(cap=self._puts % self.PRUNE_EVERY == 0)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Lỗi SQL khi ghi cache dịch: {e}")
+
+    def _prune(self, cap=True):
+        # Gọi khi đang giữ self._lock (hoặc lúc khởi tạo). Xoá mục hết hạn (index created_at),
+        # thỉnh thoảng cắt thêm các mục cũ nhất vượt quá max_disk_rows; người gọi tự commit
+        self._db.execute("DELETE FROM TranslationCache WHERE created_at < ?", (time.time() - self.ttl,))
+        if cap:
+            self._db.execute(
+                "DELETE FROM TranslationCache WHERE key IN "
+                "(SELECT key FROM TranslationCache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_rows,)
+            )
+
+    def _remember(self, key, scope, translated, created_at=None):
+        self._memory[key] = (scope, translated, time.time() if created_at is None else created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_size": len(self._memory),
+                "max_size": self.max_size,
+                "max_disk_rows": self.max_disk_rows,
+                "ttl": self.ttl,
+            }
@@ -0,0 +1,255 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class CircuitBreaker:
+    """Ngắt mạch: sau `threshold` lỗi liên tiếp thì tạm bỏ qua backend trong `reset_timeout` giây,
+    hết thời gian thì cho thử lại một lần (half-open)."""
+
+    def __init__(self, threshold=3, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "half-open":
+                # Chỉ một request được thử; các request khác coi như mạch còn mở
+                self.opened_at = time.monotonic()
+                return True
+            return state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def is_timeout(error):
+    # TimeoutError, requests.Timeout/ReadTimeout, httpx.TimeoutException...: nhận theo tên lớp,
+    # không phải import thư viện HTTP của từng backend
+    return isinstance(error, TimeoutError) or any("Timeout" in cls.__name__ for cls in type(error).__mro__)
+
+
+class TranslatorBackend:
+    """Giao diện chung cho các backend dịch; mỗi backend tự đo độ trễ của mình."""
+
+    name = "base"
+    priority = 0        # số nhỏ được ưu tiên trong chuỗi fallback
+    cacheable = True    # kết quả có được lưu vào cache dịch hay không
+
+    def __init__(self, window=200):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.ewma_ms = None
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _translate(self, text):
+        raise NotImplementedError
+
+    def translate(self, text):
+        start = time.perf_counter()
+        try:
+            return self._translate(text)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                if is_timeout(e):
+                    self.timeouts += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.calls += 1
+                self._latencies.append(elapsed)
+                self.ewma_ms = elapsed if self.ewma_ms is None else 0.8 * self.ewma_ms + 0.2 * elapsed
+
+    def stats(self):
+        with self._lock:
+            ordered = sorted(self._latencies)
+            calls, errors, timeouts, ewma = self.calls, self.errors, self.timeouts, self.ewma_ms
+
+        def percentile(p):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2)
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "timeouts": timeouts,
+            "ewma_ms": round(ewma, 2) if ewma is not None else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+
+class GoogleBackend(TranslatorBackend):
+    """deep_translator gọi requests.get không có timeout: mỗi lời gọi chạy trong pool riêng
+    và bị bỏ chờ sau `timeout` giây (TimeoutError), để ngắt mạch và metrics thấy được.
+
+    Hạn tính từ lúc luồng của pool bắt đầu gọi Google, không tính thời gian xếp hàng;
+    `workers` nên bằng số lời gọi dịch đồng thời (xem set_workers).
+    """
+
+    name = "google"
+
+    def __init__(self, source="en", target="vi", timeout=10.0, workers=32, **kwargs):
+        super().__init__(**kwargs)
+        from deep_translator import GoogleTranslator
+        self._factory = lambda: GoogleTranslator(source=source, target=target)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="google")
+
+    def set_workers(self, workers):
+        old_executor = self._executor
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="google")
+        old_executor.shutdown(wait=False)
+
+    def _call(self, text, started):
+        started.set()
+        # GoogleTranslator ghi tham số request vào chính nó: mỗi luồng một instance
+        translator = getattr(self._local, "translator", None)
+        if translator is None:
+            translator = self._local.translator = self._factory()
+        return translator.translate(text)
+
+    def _translate(self, text):
+        started = threading.Event()
+        future = self._executor.submit(self._call, text, started)
+        # Chờ tới lượt trong pool không bị tính vào hạn: chỉ Google chậm mới là timeout
+        started.wait()
+        try:
+            translated = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Google không trả lời sau {self.timeout}s") from None
+        if translated is None:
+            raise RuntimeError("Google trả về kết quả rỗng")
+        return translated
+
+
+class StubBackend(TranslatorBackend):
+    """Backend giả lập cục bộ, tất định: dùng cho test và benchmark, không gọi mạng.
+
+    Giữ nguyên placeholder và xuống dòng; có thể thêm độ trễ giả (giây) để mô phỏng upstream.
+    """
+
+    name = "stub"
+    cacheable = False
+
+    def __init__(self, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def _translate(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return "\n".join(f"[vi] {line}" if line.strip() else line for line in text.split("\n"))
+
+
+class GlossaryOnlyBackend(TranslatorBackend):
+    """Không dịch gì cả: trả lại văn bản, chỉ các thuật ngữ (placeholder) được thay bằng glossary."""
+
+    name = "glossary"
+    priority = 10
+    cacheable = False
+
+    def _translate(self, text):
+        return text
+
+
+class FallbackChain:
+    """Chuỗi backend có ngắt mạch: thử lần lượt theo (priority, độ trễ EWMA),
+    bỏ qua backend đang ngắt mạch, chuyển sang backend kế tiếp khi lỗi."""
+
+    def __init__(self, backends, threshold=3, reset_timeout=30.0):
+        self.backends = list(backends)
+        self.breakers = {b.name: CircuitBreaker(threshold, reset_timeout) for b in self.backends}
+
+    def _candidates(self):
+        def latency(backend):
+            return backend.ewma_ms if backend.ewma_ms is not None else 0.0
+        return sorted(self.backends, key=lambda b: (b.priority, latency(b)))
+
+    def translate_with_backend(self, text):
+        """Trả về (bản dịch, backend đã dịch)."""
+        last_error = None
+        for backend in self._candidates():
+            breaker = self.breakers[backend.name]
+            if not breaker.allow():
+                continue
+            try:
+                translated = backend.translate(text)
+            except Exception as e:
+                breaker.record_failure()
+                print(f"Lỗi backend dịch {backend.name}: {e}")
+                last_error = e
+                continue
+            breaker.record_success()
+            return translated, backend
+        raise last_error or RuntimeError("Không có backend dịch nào khả dụng")
+
+    def translate(self, text):
+        return self.translate_with_backend(text)[0]
+
+    def set_workers(self, workers):
+        # Cỡ pool riêng của các backend có pool (Google), theo số lời gọi dịch đồng thời
+        for backend in self.backends:
+            if hasattr(backend, "set_workers"):
+                backend.set_workers(workers)
+
+    def stats(self):
+        return {
+            b.name: dict(b.stats(), circuit=self.breakers[b.name].state, priority=b.priority)
+            for b in self.backends
+        }
+
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "stub": StubBackend,
+    "glossary": GlossaryOnlyBackend,
+}
+
+
+def build_translator(spec="google,glossary", stub_latency=0.0, timeout=10.0, workers=32, **options):
+    """Dựng FallbackChain từ danh sách tên backend, ví dụ "google,glossary" hoặc "stub".
+
+    timeout: hạn (giây) cho mỗi lời gọi Google; workers: số luồng gọi Google cùng lúc.
+    """
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown or not names:
+        raise ValueError(f"Backend dịch không hỗ trợ: {spec!r}")
+    backends = []
+    for name in names:
+        if name == "stub":
+            backends.append(StubBackend(latency=stub_latency))
+        elif name == "google":
+            backends.append(GoogleBackend(timeout=timeout, workers=workers))
+        else:
+            backends.append(BACKENDS[name]())
+    return FallbackChain(backends, **options)
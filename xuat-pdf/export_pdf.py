@@ -1,86 +1,140 @@
 # export_html_full.py
-import pandas as pd
-import re
+import argparse
+import hashlib
+import json
 import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from urllib.parse import unquote
+
+import pandas as pd
+
+# Dùng chung bộ so khớp thuật ngữ (Aho-Corasick) với app.py ở thư mục gốc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from term_matcher import TermMatcher
 
 # ========== CẤU HÌNH ==========
 CSV_FILE = "iot.csv"
+DB_FILE = os.path.join("..", "database1.db")   # dùng khi chạy với --db
 OUT_HTML = "dictionary1.html"
 # Nếu muốn in 2 cột, set True; nếu muốn 1 cột, set False
 TWO_COLUMN = False
 # Title
 DOC_TITLE = "TỪ ĐIỂN CHUYÊN NGÀNH OT và IoT security (English - Vietnamese)"
+# Số dòng đọc mỗi lần từ CSV / SQLite
+CHUNK_ROWS = 500
+# Thư mục giữ HTML từng nhóm chữ cái + hash nội dung, để lần sau chỉ dựng lại nhóm thay đổi
+BUILD_DIR = ".export_cache"
+# Mỗi nhóm chữ cái còn được xuất thành một tài liệu riêng (shard) để phân trang/in PDF
+# song song; index.html chứa mục lục chung trỏ tới anchor trong các shard
+SHARD_DIR = "shards"
+OUT_PDF = "tudienIOT.pdf"
+# CLI dựng PDF từ HTML có paged.js (npm install -g pagedjs-cli)
+PAGEDJS_CLI = os.environ.get("PAGEDJS_CLI", "pagedjs-cli")
 # ========== /CẤU HÌNH ==========
 
-# ---- load CSV
-df = pd.read_csv(CSV_FILE, encoding="utf-8", on_bad_lines="skip")
-df = df.rename(columns={
-    "english": "english",
-    "vietnamese": "vietnamese",
-    "note": "note",
-    "vi_du": "example"
-})
-df.fillna("", inplace=True)
-df = df.sort_values("english", key=lambda s: s.str.lower())
-
-terms = df["english"].tolist()
-
-# ---- helper: extract sub-terms that exist in database
-def extract_sub_terms(text):
+COLUMNS = ["english", "vietnamese", "note", "vi_du"]
+# Tăng khi đổi HTML của term block để mọi nhóm được dựng lại
+BLOCK_TEMPLATE_VERSION = "2"
+
+
+# ---- đọc dữ liệu theo từng khối: mỗi dòng là (english, vietnamese, note, example)
+def _clean(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value)
+
+def iter_csv_rows(path, chunk_rows=CHUNK_ROWS):
+    chunks = pd.read_csv(path, encoding="utf-8", on_bad_lines="skip", dtype=str,
+                         keep_default_na=False, chunksize=chunk_rows)
+    for chunk in chunks:
+        chunk = chunk.reindex(columns=COLUMNS, fill_value="")
+        for row in chunk.itertuples(index=False, name=None):
+            yield tuple(_clean(value) for value in row)
+
+def iter_db_rows(path, module=None, chunk_rows=CHUNK_ROWS):
+    # Mở chỉ đọc: không tạo file rỗng khi đường dẫn sai, không khoá DB của app
+    conn = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        sql = "SELECT english, vietnamese, note, vi_du FROM Terms"
+        params = []
+        if module:
+            sql += " WHERE module = ?"
+            params.append(module)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(_clean(value) for value in row)
+    finally:
+        conn.close()
+
+# ---- helper: link sub-terms that exist in database
+# Một bộ so khớp dựng sẵn cho mọi thuật ngữ: mỗi note chỉ quét một lượt (không phân biệt
+# hoa/thường, nguyên từ, thuật ngữ dài nhất được ưu tiên), thay vì một regex cho mỗi thuật ngữ
+def local_href(t):
+    return f"#{t}"
+
+def link_sub_terms(matcher, text, href=local_href):
+    """Trả về (text đã gắn link tới các thuật ngữ con, danh sách thuật ngữ con theo thứ tự xuất hiện)."""
     found = []
     if not text:
-        return found
-    for t in terms:
-        # match whole word, case-insensitive
-        if re.search(rf"\b{re.escape(t)}\b", text, flags=re.IGNORECASE):
-            if t not in found and t.strip() != "":
-                found.append(t)
-    return found
-
-# ---- Build TOC grouped by initial letter
-from collections import defaultdict
-groups = defaultdict(list)
-for t in terms:
-    first = t[0].upper() if t else "#"
+        return text, found
+    parts = []
+    last = 0
+    for start, end, _, t in matcher.find(text):
+        # giữ nguyên cách viết hoa/thường trong note, link tới anchor của thuật ngữ
+        parts.append(text[last:start])
+        parts.append(f"<a href='{href(t)}' class='in-link'>{text[start:end]}</a>")
+        last = end
+        if t not in found:
+            found.append(t)
+    parts.append(text[last:])
+    return "".join(parts), found
+
+# ---- nhóm theo chữ cái đầu (TOC và các section)
+def letter_of(term):
+    first = term[0].upper() if term else "#"
     if not first.isalpha():
         first = "#"
-    groups[first].append(t)
+    return first
+
+def sort_letters(letters):
+    return sorted(letters, key=lambda c: (c!="#", c))  # '#' last or first; adjust
 
-sorted_letters = sorted(groups.keys(), key=lambda c: (c!="#", c))  # '#' last or first; adjust
+def section_file(letter):
+    return f"section-{ord(letter):04x}.html"
+
+def shard_href(letter, t):
+    # Trong shard của `letter`: thuật ngữ cùng nhóm dùng anchor nội bộ, nhóm khác trỏ sang file shard kia
+    target = letter_of(t)
+    return f"#{t}" if target == letter else f"{section_file(target)}#{t}"
 
 # ---- Build content blocks
-content_blocks = []
-for _, row in df.iterrows():
-    eng = row["english"]
-    vi = row["vietnamese"]
-    note = row["note"]
-    ex  = row["example"]
-
-    subs = extract_sub_terms(note)
-
-    # Replace occurrences in note with links (only for subs that exist)
-    linked_note = note
-    for sub in subs:
-        # use regex to replace whole-word, preserve original case
-        linked_note = re.sub(
-            rf"(\b){re.escape(sub)}(\b)",
-            rf"\1<a href='#{sub}' class='in-link'>{sub}</a>\2",
-            linked_note,
-            flags=re.IGNORECASE
-        )
+def render_block(row, linked_note, subs, href=local_href, toc_href="#toc"):
+    eng, vi, note, ex = row
 
     see_more_html = ""
     if subs:
-        links = ", ".join([f"<a href='#{s}' class='in-link'>{s}</a>" for s in subs])
+        links = ", ".join([f"<a href='{href(s)}' class='in-link'>{s}</a>" for s in subs])
         see_more_html = f"<div class='see-more'><b>Xem thêm:</b> {links}</div>"
 
+    # Tên thuật ngữ tự link tới anchor của nó: Chromium chỉ xuất named destination cho anchor
+    # có link trỏ tới, và link từ shard khác được nối vào các destination này khi ghép PDF
     # back-to-top link (JS/CSS will style)
-    block = {
-        "anchor": eng,
-        "html": f"""
+    return f"""
 <a id="{eng}"></a>
 <section class="term-block" data-term="{eng}">
-    <div class="term">{eng}</div>
+    <div class="term"><a href="{href(eng)}" class="term-link">{eng}</a></div>
 
     <div class="meta"><span class="label">Dịch:</span>
         <span class="vietnamese">{vi}</span>
@@ -95,34 +149,48 @@ for _, row in df.iterrows():
     </div>
 
     {see_more_html}
-    <div class="tools"><a class="back-top" href="#toc">↑ Lên đầu</a></div>
+    <div class="tools"><a class="back-top" href="{toc_href}">↑ Lên đầu</a></div>
 </section>
 """
-    }
-    content_blocks.append(block)
 
-# ---- Build TOC HTML (clickable)
-toc_entries = []
-for letter in sorted_letters:
-    names = groups[letter]
-    # sort names alphabetically
-    names = sorted(names, key=lambda s: s.lower())
-    items = " · ".join([f"<a href='#{n}' class='toc-link'>{n}</a>" for n in names])
-    toc_entries.append(f"<div class='toc-group'><h3>{letter}</h3><div class='toc-items'>{items}</div></div>")
+def section_digest(linked_rows):
+    # Hash theo dữ liệu của nhóm và các thuật ngữ con được link tới (thêm/bớt thuật ngữ
+    # ở nhóm khác chỉ làm dựng lại nhóm nào có note nhắc tới thuật ngữ đó)
+    digest = hashlib.sha1(BLOCK_TEMPLATE_VERSION.encode("utf-8"))
+    for row, _, subs in linked_rows:
+        digest.update(json.dumps([row, subs], ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+def write_atomic(path, chunks):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
 
-toc_html = "<div id='toc' class='toc'><h2>Mục lục</h2>" + "\n".join(toc_entries) + "</div>"
+# ---- Build TOC HTML (clickable)
+def render_toc(letters, groups, href=local_href):
+    toc_entries = []
+    for letter in letters:
+        names = [row[0] for row in groups[letter]]
+        items = " · ".join([f"<a href='{href(n)}' class='toc-link'>{n}</a>" for n in names])
+        toc_entries.append(f"<div class='toc-group'><h3>{letter}</h3><div class='toc-items'>{items}</div></div>")
+    return "<div id='toc' class='toc'><h2>Mục lục</h2>" + "\n".join(toc_entries) + "</div>"
 
 # ---- final HTML template (includes paged.polyfill.js if present)
-paged_js_exists = os.path.exists("paged.polyfill.js")
-paged_script_tag = "<script src='paged.polyfill.js'></script>" if paged_js_exists else "<!-- paged.polyfill.js not found: download for advanced page features -->"
+def render_head(toc_html, title=DOC_TITLE, asset_prefix="", page_footer=True):
+    # page_footer=False cho các shard: số trang được đóng lên PDF sau khi ghép (build_pdf),
+    # phân trang từng shard riêng thì shard nào cũng bắt đầu lại từ "Trang 1"
+    footer_content = '"Trang " counter(page) " / " counter(pages)' if page_footer else "none"
+    paged_script_tag = f"<script src='{asset_prefix}paged.polyfill.js'></script>" if paged_js_exists() else "<!-- paged.polyfill.js not found: download for advanced page features -->"
 
-two_column_class = "two-column" if TWO_COLUMN else ""
+    two_column_class = "two-column" if TWO_COLUMN else ""
 
-html_template = f"""<!doctype html>
+    return f"""<!doctype html>
 <html lang="vi">
 <head>
 <meta charset="utf-8">
-<title>{DOC_TITLE}</title>
+<title>{title}</title>
 {paged_script_tag}
 <style>
 /* --- Basic layout --- */
@@ -186,6 +254,10 @@ h1 {{
     font-weight: 700;
     margin-bottom: 8px;
 }}
+.term a.term-link {{
+    color: inherit;
+    text-decoration: none;
+}}
 .meta {{ margin: 6px 0; }}
 .label {{ font-weight:700; color:#444; margin-right:6px; }}
 .vietnamese {{ color: #005fb8; }}
@@ -228,7 +300,7 @@ a.in-link, a.toc-link, .see-more a {{
 /* ========= Footer for page numbers (paged.js support) ========= */
 @page {{
     @bottom-center {{
-        content: "Trang " counter(page) " / " counter(pages);
+        content: {footer_content};
         font-size: 12px;
         color: #666;
     }}
@@ -245,41 +317,265 @@ a.in-link, a.toc-link, .see-more a {{
 </style>
 </head>
 <body class="{two_column_class}">
-<header><h1>{DOC_TITLE}</h1></header>
+<header><h1>{title}</h1></header>
 
 <nav>
 {toc_html}
 </nav>
 
 <main class="content-wrapper">
-{"".join([b["html"] for b in content_blocks])}
+"""
+
+def paged_js_exists():
+    return os.path.exists("paged.polyfill.js")
+
+HTML_TAIL = """
 </main>
 
 <script>
 // small enhancement: when clicking an internal link, scroll smoothly (works in browser)
-document.querySelectorAll('a[href^="#"]').forEach(a => {{
-    a.addEventListener('click', function(e) {{
+document.querySelectorAll('a[href^="#"]').forEach(a => {
+    a.addEventListener('click', function(e) {
         const targetId = this.getAttribute('href').slice(1);
         const el = document.getElementById(targetId) || document.querySelector('a[name="'+targetId+'"]');
-        if (el) {{
+        if (el) {
             e.preventDefault();
-            el.scrollIntoView({{behavior: 'smooth', block: 'center'}});
+            el.scrollIntoView({behavior: 'smooth', block: 'center'});
             // update hash without default jump
             history.pushState(null, null, '#'+targetId);
-        }}
-    }});
-}});
+        }
+    });
+});
 </script>
 </body>
 </html>
 """
 
-# write output
-with open(OUT_HTML, "w", encoding="utf-8") as f:
-    f.write(html_template)
-
-print(f"✅ Đã tạo {OUT_HTML}.")
-print("Mở file bằng Chrome, Ctrl+P -> Save as PDF (chọn Background graphics).")
-if not paged_js_exists:
-    print("Khuyến nghị: tải paged.polyfill.js vào cùng thư mục để có hỗ trợ @page tốt hơn:")
-    print("https://unpkg.com/pagedjs/dist/paged.polyfill.js")
+# ---- Build: đọc theo khối, chỉ dựng lại section có hash thay đổi, ghi HTML từng phần
+def load_manifest(build_dir):
+    try:
+        with open(os.path.join(build_dir, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Mỗi process con dựng bộ so khớp một lần (initializer), rồi nhận từng nhóm chữ cái
+_worker_matcher = None
+
+def init_worker(terms):
+    global _worker_matcher
+    _worker_matcher = TermMatcher((t, t) for t in terms)
+
+def render_letter(task, build_dir, shard_dir, full=False):
+    """Dựng section (cho file gộp) và shard (tài liệu riêng) của một nhóm chữ cái nếu hash đổi.
+
+    Trả về (letter, digest, đã dựng lại hay chưa).
+    """
+    letter, rows, old_digest = task
+    linked_rows = [(row, *link_sub_terms(_worker_matcher, row[2])) for row in rows]
+    digest = section_digest(linked_rows)
+    section_path = os.path.join(build_dir, section_file(letter))
+    shard_path = os.path.join(shard_dir, section_file(letter))
+    if not full and digest == old_digest and os.path.exists(section_path) and os.path.exists(shard_path):
+        return letter, digest, False
+
+    write_atomic(section_path, (render_block(row, linked_note, subs) for row, linked_note, subs in linked_rows))
+
+    href = partial(shard_href, letter)
+    nav = "<a class='toc-link' href='index.html#toc'>↑ Mục lục</a>"
+    write_atomic(shard_path, [
+        render_head(nav, title=f"{DOC_TITLE} — {letter}", asset_prefix="../", page_footer=False),
+        *(render_block(row, link_sub_terms(_worker_matcher, row[2], href)[0], subs, href, "index.html#toc")
+          for row, _, subs in linked_rows),
+        HTML_TAIL,
+    ])
+    return letter, digest, True
+
+def build(rows, out_html=OUT_HTML, build_dir=BUILD_DIR, shard_dir=SHARD_DIR, full=False, workers=None):
+    """Dựng out_html và các shard từ các dòng (english, vietnamese, note, example).
+
+    Trả về tên các shard đã dựng lại ("index" nếu mục lục chung đổi, và các chữ cái).
+    """
+    groups = defaultdict(list)
+    for row in rows:
+        groups[letter_of(row[0])].append(row)
+    for letter_rows in groups.values():
+        letter_rows.sort(key=lambda row: row[0].lower())
+    letters = sort_letters(groups)
+
+    terms = sorted((row[0] for letter_rows in groups.values() for row in letter_rows), key=lambda s: s.lower())
+
+    os.makedirs(build_dir, exist_ok=True)
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = {} if full else load_manifest(build_dir)
+    tasks = [(letter, groups[letter], manifest.get(letter)) for letter in letters]
+    render = partial(render_letter, build_dir=build_dir, shard_dir=shard_dir, full=full)
+
+    # Các nhóm chữ cái độc lập với nhau: dựng song song trong process pool
+    if workers == 1:
+        init_worker(terms)
+        results = [render(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(terms,)) as pool:
+            results = list(pool.map(render, tasks))
+    new_manifest = {letter: digest for letter, digest, _ in results}
+    rebuilt = [letter for letter, _, changed in results if changed]
+
+    # Mục lục chung: trong file gộp dùng anchor nội bộ, trong index.html trỏ tới từng shard
+    index_html = render_head(render_toc(letters, groups, href=lambda t: f"{section_file(letter_of(t))}#{t}"),
+                             asset_prefix="../", page_footer=False) + HTML_TAIL
+    new_manifest["index"] = hashlib.sha1(index_html.encode("utf-8")).hexdigest()
+    index_path = os.path.join(shard_dir, "index.html")
+    if new_manifest["index"] != manifest.get("index") or not os.path.exists(index_path):
+        write_atomic(index_path, [index_html])
+        rebuilt.insert(0, "index")
+
+    # Xoá section/shard của nhóm chữ cái không còn thuật ngữ nào
+    for letter in set(manifest) - set(new_manifest):
+        for path in (os.path.join(build_dir, section_file(letter)),
+                     os.path.join(shard_dir, section_file(letter)),
+                     os.path.join(shard_dir, shard_pdf(section_file(letter)))):
+            if os.path.exists(path):
+                os.remove(path)
+    write_atomic(os.path.join(build_dir, "manifest.json"), [json.dumps(new_manifest, ensure_ascii=False)])
+
+    # Ghép file cuối: đầu trang + TOC, chép nội dung từng section, rồi phần đuôi
+    tmp_path = out_html + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        out.write(render_head(render_toc(letters, groups)))
+        for letter in letters:
+            with open(os.path.join(build_dir, section_file(letter)), encoding="utf-8") as section:
+                shutil.copyfileobj(section, out)
+        out.write(HTML_TAIL)
+    os.replace(tmp_path, out_html)
+    return rebuilt, letters
+
+# ---- PDF: phân trang từng shard song song bằng pagedjs-cli, rồi ghép theo thứ tự mục lục
+def shard_pdf(name):
+    return os.path.splitext(name)[0] + ".pdf"
+
+def render_pdf(shard_dir, name):
+    html_path = os.path.join(shard_dir, name)
+    pdf_path = os.path.join(shard_dir, shard_pdf(name))
+    subprocess.run([PAGEDJS_CLI, html_path, "-o", pdf_path], check=True, capture_output=True)
+    return pdf_path
+
+# Link sang shard khác trong PDF của Chromium là URI tới file: .../section-0041.html#API
+SHARD_LINK = re.compile(r"(?:^|/)(index\.html|section-[0-9a-f]{4}\.html)#(.*)$")
+# Độ rộng glyph Helvetica (1/1000 em) cho các ký tự của "Trang 12 / 345", để canh giữa số trang
+HELVETICA_WIDTHS = dict.fromkeys("0123456789agn", 556) | {"T": 611, "r": 333, " ": 278, "/": 278}
+
+def link_shards(writer, first_pages):
+    """Đổi link URI giữa các shard thành link nội bộ của PDF đã ghép.
+
+    first_pages: {tên file shard: chỉ số trang đầu trong PDF ghép}. Link trỏ tới named destination
+    cùng tên anchor nếu có, không thì tới trang đầu của shard đích.
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, NameObject, TextStringObject
+
+    names = set(writer.named_destinations)
+    for page in writer.pages:
+        for annot in page.get("/Annots") or []:
+            annot = annot.get_object()
+            action = annot.get("/A")
+            action = action.get_object() if action is not None else None
+            if annot.get("/Subtype") != "/Link" or action is None or action.get("/S") != "/URI":
+                continue
+            match = SHARD_LINK.search(str(action.get("/URI", "")))
+            if not match or match.group(1) not in first_pages:
+                continue
+            fragment = match.group(2)
+            name = next((n for n in (fragment, unquote(fragment)) if n in names), None)
+            if name is not None:
+                dest = TextStringObject(name)
+            else:
+                target = writer.pages[first_pages[match.group(1)]]
+                dest = ArrayObject([target.indirect_reference, NameObject("/Fit")])
+            annot[NameObject("/A")] = DictionaryObject({
+                NameObject("/S"): NameObject("/GoTo"),
+                NameObject("/D"): dest,
+            })
+
+def stamp_page_numbers(writer, font_size=9, bottom=11):
+    """Đóng "Trang i / N" ở giữa lề dưới mỗi trang của PDF đã ghép (Helvetica chuẩn, không nhúng font)."""
+    from pypdf.generic import ContentStream, DictionaryObject, NameObject
+
+    total = len(writer.pages)
+    for number, page in enumerate(writer.pages, start=1):
+        text = f"Trang {number} / {total}"
+        width = sum(HELVETICA_WIDTHS[c] for c in text) * font_size / 1000
+        box = page.mediabox
+        x = float(box.left) + (float(box.width) - width) / 2
+        y = float(box.bottom) + bottom
+
+        resources = page.setdefault(NameObject("/Resources"), DictionaryObject()).get_object()
+        fonts = resources.setdefault(NameObject("/Font"), DictionaryObject()).get_object()
+        fonts[NameObject("/FTrang")] = DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+            NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+        })
+        # Bọc nội dung cũ trong q/Q để trạng thái đồ hoạ của trang không ảnh hưởng tới số trang
+        old = page.get_contents()
+        stamp = f"q 0.4 g BT /FTrang {font_size} Tf {x:.2f} {y:.2f} Td ({text}) Tj ET Q".encode("latin-1")
+        content = ContentStream(None, writer)
+        content.set_data(b"q\n" + (old.get_data() if old is not None else b"") + b"\nQ\n" + stamp)
+        page.replace_contents(content)
+        page.compress_content_streams()
+
+def build_pdf(letters, rebuilt, out_pdf=OUT_PDF, shard_dir=SHARD_DIR, workers=None):
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        print("⚠ Cần pypdf để ghép PDF: pip install pypdf")
+        return False
+    if shutil.which(PAGEDJS_CLI) is None:
+        print(f"⚠ Không tìm thấy {PAGEDJS_CLI}: npm install -g pagedjs-cli")
+        return False
+
+    names = ["index.html"] + [section_file(letter) for letter in letters]
+    changed = {"index.html" if name == "index" else section_file(name) for name in rebuilt}
+    # Chỉ phân trang lại shard đã đổi (hoặc chưa có PDF); mỗi lần gọi là một process riêng
+    pending = [name for name in names
+               if name in changed or not os.path.exists(os.path.join(shard_dir, shard_pdf(name)))]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(partial(render_pdf, shard_dir), pending))
+
+    writer = PdfWriter()
+    first_pages = {}
+    for name, title in zip(names, ["Mục lục"] + letters):
+        first_pages[name] = len(writer.pages)
+        writer.append(os.path.join(shard_dir, shard_pdf(name)), outline_item=title)
+    # Mỗi shard được phân trang riêng: số trang và link giữa các shard chỉ làm được sau khi ghép
+    link_shards(writer, first_pages)
+    stamp_page_numbers(writer)
+    with open(out_pdf, "wb") as f:
+        writer.write(f)
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Xuất từ điển ra HTML để in PDF.")
+    parser.add_argument("--csv", default=CSV_FILE, help="file CSV nguồn (mặc định: %(default)s)")
+    parser.add_argument("--db", nargs="?", const=DB_FILE, help="đọc từ bảng Terms của SQLite thay vì CSV (mặc định: %(const)s)")
+    parser.add_argument("--module", help="chỉ xuất một module khi đọc từ --db")
+    parser.add_argument("--out", default=OUT_HTML, help="file HTML đầu ra (mặc định: %(default)s)")
+    parser.add_argument("--full", action="store_true", help="bỏ qua cache, dựng lại mọi nhóm chữ cái")
+    parser.add_argument("--workers", type=int, help="số process dựng shard song song (mặc định: số CPU)")
+    parser.add_argument("--pdf", nargs="?", const=OUT_PDF, help="phân trang các shard và ghép thành PDF (mặc định: %(const)s)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rows = iter_db_rows(args.db, args.module) if args.db else iter_csv_rows(args.csv)
+    rebuilt, letters = build(rows, args.out, full=args.full, workers=args.workers)
+
+    print(f"✅ Đã tạo {args.out} và {SHARD_DIR}/ (dựng lại {len(rebuilt)} shard: {' '.join(rebuilt) or 'không có'}).")
+    if args.pdf and build_pdf(letters, rebuilt, args.pdf, workers=args.workers):
+        print(f"✅ Đã tạo {args.pdf}.")
+    else:
+        print("Mở file bằng Chrome, Ctrl+P -> Save as PDF (chọn Background graphics).")
+    if not paged_js_exists():
+        print("Khuyến nghị: tải paged.polyfill.js vào cùng thư mục để có hỗ trợ @page tốt hơn:")
+        print("https://unpkg.com/pagedjs/dist/paged.polyfill.js")